@@ -1,5 +1,6 @@
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from queue import Queue
 from typing import Any
 
@@ -7,6 +8,13 @@ import requests
 from requests.compat import urljoin
 from tenacity import after_log, retry, retry_if_exception_type
 
+from circuit_breaker import Circuit_Breaker
+from cloud_mirror import Cloud_Mirror
+from lag_model import Lag_Model
+from local_explorer import Local_Explorer
+from online_cache import Online_Cache
+from rate_limiter import Rate_Limiter
+from source_telemetry import Source_Telemetry
 from lichess_bot_dataclasses import API_Challenge_Reponse, Challenge_Request
 from enums import Decline_Reason, Variant
 
@@ -19,6 +27,17 @@ class API:
         self.session = requests.session()
         self.session.headers.update({'Authorization': f'Bearer {config["token"]}',
                                      'User-Agent': f'Lichess-Bot/{config["version"]}'})
+        self.lag_model = Lag_Model(config)
+        self.online_cache = Online_Cache(config)
+        self.local_explorer = Local_Explorer(config)
+        self.cloud_mirror = Cloud_Mirror(config)
+        self.circuit_breaker = Circuit_Breaker(config)
+        self.source_telemetry = Source_Telemetry(config)
+        self.executor = ThreadPoolExecutor(thread_name_prefix='Online request')
+        # Prefetches have their own small pool, so they never queue ahead of the requests of a game on turn.
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='Online prefetch')
+        prefetch_config: dict = config.get('online_prefetch', {})
+        self.prefetch_rate_limiter = Rate_Limiter(prefetch_config.get('requests_per_minute', 30), 60.0)
 
     def set_user_agent(self, version: str, username: str) -> None:
         self.session.headers.update({'User-Agent': f'BotLi/{version} user:{username}'})
@@ -107,7 +126,7 @@ class API:
 
         return json_response
 
-    def get_chessdb_eval(self, fen: str, timeout: int) -> dict[str, Any] | None:
+    def get_chessdb_eval(self, fen: str, timeout: float) -> dict[str, Any] | None:
         try:
             response = self.session.get('http://www.chessdb.cn/cdb.php',
                                         params={'action': 'querypv', 'board': fen, 'json': 1},
@@ -116,17 +135,22 @@ class API:
             response.raise_for_status()
             return response.json()
         except (requests.Timeout, requests.HTTPError, requests.ConnectionError) as e:
+            self._check_rate_limit('chessdb', e)
             print(e)
 
-    def get_cloud_eval(self, fen: str, variant: Variant, timeout: int) -> dict[str, Any] | None:
+    def get_cloud_eval(self, fen: str, variant: Variant, timeout: float) -> dict[str, Any] | None:
         try:
             response = self.session.get('https://lichess.org/api/cloud-eval',
                                         params={'fen': fen, 'variant': variant.value}, timeout=timeout)
+            if response.status_code == 429:
+                self.circuit_breaker.record_rate_limit('lichess_cloud')
+                return
+
             return response.json()
         except (requests.Timeout, requests.ConnectionError) as e:
             print(e)
 
-    def get_egtb(self, fen: str, variant: str, timeout: int) -> dict[str, Any] | None:
+    def get_egtb(self, fen: str, variant: str, timeout: float) -> dict[str, Any] | None:
         try:
             response = self.session.get(
                 f'https://tablebase.lichess.ovh/{variant}', params={'fen': fen},
@@ -135,6 +159,7 @@ class API:
             response.raise_for_status()
             return response.json()
         except (requests.Timeout, requests.HTTPError, requests.ConnectionError) as e:
+            self._check_rate_limit('online_egtb', e)
             print(e)
 
     @retry(after=after_log(logger, logging.DEBUG))
@@ -160,7 +185,7 @@ class API:
                              fen: str,
                              variant: Variant,
                              color: str,
-                             timeout: int
+                             timeout: float
                              ) -> dict[str, Any] | None:
         try:
             response = self.session.get('https://explorer.lichess.ovh/player',
@@ -173,6 +198,7 @@ class API:
             first_line = next(filter(None, response.iter_lines()))
             return json.loads(first_line)
         except (requests.Timeout, requests.HTTPError, requests.ConnectionError) as e:
+            self._check_rate_limit('opening_explorer', e)
             print(e)
 
     @retry(retry=retry_if_exception_type((requests.ConnectionError, requests.Timeout)),
@@ -231,6 +257,10 @@ class API:
             print(e)
             return False
 
+    def _check_rate_limit(self, source: str, error: requests.RequestException) -> None:
+        if isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code == 429:
+            self.circuit_breaker.record_rate_limit(source)
+
     def _get_urls(self, config: dict[str, Any]) -> dict[str, str]:
         url = config.get('url', 'https://lichess.org')
         return {
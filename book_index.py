@@ -0,0 +1,161 @@
+import json
+import mmap
+import os
+import struct
+import time
+from collections.abc import Callable, Iterator
+from heapq import merge
+from itertools import groupby
+from typing import NamedTuple
+
+import chess
+import chess.polyglot
+
+MAGIC = b'BOOKIDX1'
+HEADER_STRUCT = struct.Struct('>8sI')
+POLYGLOT_STRUCT = struct.Struct('>QHHI')
+# Zobrist key, raw polyglot move, book number, weight in percent of the position in its book, learn
+RECORD_STRUCT = struct.Struct('>QHBfI')
+
+
+def bisect_key_left(key: int, size: int, read_key: Callable[[int], int]) -> int:
+    '''Returns the index of the first of size records sorted by key whose key is not less than key.'''
+
+    low = 0
+    high = size
+    while low < high:
+        middle = (low + high) // 2
+        if read_key(middle) < key:
+            low = middle + 1
+        else:
+            high = middle
+
+    return low
+
+
+class Book_Index_Entry(NamedTuple):
+    move: chess.Move
+    book: str
+    weight: float
+    learn: int
+
+
+class Book_Index:
+    '''Merged index of several polyglot books, sorted by Zobrist key and then by the order of the books.
+
+    Every record keeps the weight in percent of its position in its book, the learn value and the book it came
+    from, so a lookup is a single binary search in one memory mapped file.'''
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as index_file:
+            self.mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        _, header_length = HEADER_STRUCT.unpack_from(self.mmap)
+        self.names: list[str] = json.loads(self.mmap[HEADER_STRUCT.size:HEADER_STRUCT.size + header_length])['names']
+        self.offset = HEADER_STRUCT.size + header_length
+        self.size = (len(self.mmap) - self.offset) // RECORD_STRUCT.size
+
+    @classmethod
+    def open(cls, path: str, books: dict[str, str]) -> 'Book_Index':
+        if cls._read_signature(path) != cls._get_signature(books):
+            print(f'Building book index "{path}" ...')
+            build_start = time.perf_counter()
+            cls.build(path, books)
+            print(f'Book index "{path}" built in {time.perf_counter() - build_start:.1f} s.')
+
+        return cls(path)
+
+    @staticmethod
+    def build(path: str, books: dict[str, str]) -> None:
+        header = json.dumps({'names': list(books), 'signature': Book_Index._get_signature(books)}).encode()
+        groups = [Book_Index._read_positions(book_number, book_path)
+                  for book_number, book_path in enumerate(books.values())]
+
+        if directory := os.path.dirname(path):
+            os.makedirs(directory, exist_ok=True)
+
+        # Polyglot books are sorted by key, so merging them streams the index without sorting it in memory.
+        with open(f'{path}.tmp', 'wb') as index_file:
+            index_file.write(HEADER_STRUCT.pack(MAGIC, len(header)))
+            index_file.write(header)
+
+            for key, book_number, entries in merge(*groups, key=lambda group: group[:2]):
+                total_weight = sum(weight for _, weight, _ in entries)
+                for raw_move, weight, learn in entries:
+                    index_file.write(RECORD_STRUCT.pack(key, raw_move, book_number,
+                                                        weight / total_weight * 100.0, learn))
+
+        os.replace(f'{path}.tmp', path)
+
+    def find_all(self, board: chess.Board) -> list[Book_Index_Entry]:
+        key = chess.polyglot.zobrist_hash(board)
+        index = bisect_key_left(key, self.size, lambda index: self._read_record(index)[0])
+        entries: list[Book_Index_Entry] = []
+
+        while index < self.size:
+            record_key, raw_move, book_number, weight, learn = self._read_record(index)
+            if record_key != key:
+                break
+
+            index += 1
+            move = self._decode_move(board, raw_move)
+            if board.is_legal(move):
+                entries.append(Book_Index_Entry(move, self.names[book_number], weight, learn))
+
+        return entries
+
+    def close(self) -> None:
+        self.mmap.close()
+
+    def _read_record(self, index: int) -> tuple[int, int, int, float, int]:
+        return RECORD_STRUCT.unpack_from(self.mmap, self.offset + index * RECORD_STRUCT.size)
+
+    def _decode_move(self, board: chess.Board, raw_move: int) -> chess.Move:
+        to_square = raw_move & 0x3f
+        from_square = (raw_move >> 6) & 0x3f
+        promotion_part = (raw_move >> 12) & 0x7
+        promotion = promotion_part + 1 if promotion_part else None
+
+        if from_square == to_square:
+            # Piece drop, the promotion bits hold the dropped piece.
+            return chess.Move(from_square, to_square, drop=promotion)
+
+        # Same normalization of castling moves python-chess applies in its own polyglot reader.
+        return board._from_chess960(board.chess960,  # pylint: disable=protected-access
+                                    from_square, to_square, promotion)
+
+    @staticmethod
+    def _read_positions(book_number: int, book_path: str) -> Iterator[tuple[int, int, list[tuple[int, int, int]]]]:
+        if not os.path.getsize(book_path):
+            return
+
+        with open(book_path, 'rb') as book_file, \
+                mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ) as book_mmap:
+            book_entries = (POLYGLOT_STRUCT.unpack_from(book_mmap, offset)
+                            for offset in range(0, len(book_mmap) - POLYGLOT_STRUCT.size + 1, POLYGLOT_STRUCT.size))
+            for key, entries in groupby(book_entries, key=lambda entry: entry[0]):
+                # Entries with weight 0 are deleted entries.
+                moves = [(raw_move, weight, learn) for _, raw_move, weight, learn in entries if weight]
+                if moves:
+                    yield key, book_number, moves
+
+    @staticmethod
+    def _get_signature(books: dict[str, str]) -> list[list]:
+        signature: list[list] = []
+        for name, book_path in books.items():
+            book_stat = os.stat(book_path)
+            signature.append([name, os.path.abspath(book_path), book_stat.st_size, book_stat.st_mtime_ns])
+
+        return signature
+
+    @staticmethod
+    def _read_signature(path: str) -> list[list] | None:
+        try:
+            with open(path, 'rb') as index_file:
+                magic, header_length = HEADER_STRUCT.unpack(index_file.read(HEADER_STRUCT.size))
+                if magic != MAGIC:
+                    return
+
+                return json.loads(index_file.read(header_length))['signature']
+        except (OSError, struct.error, ValueError, KeyError):
+            return
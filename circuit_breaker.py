@@ -0,0 +1,129 @@
+import time
+from collections import defaultdict, deque
+from threading import Lock
+
+
+class Source_Health:
+    '''Recent requests of one online source and the state of its circuit.
+
+    closed: requests are allowed. open: requests are skipped until open_time has passed.
+    half_open: a single probe request decides whether the circuit closes or opens again.'''
+
+    def __init__(self, window: int) -> None:
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.successes: deque[bool] = deque(maxlen=window)
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.last_request = 0.0
+        self.rate_limits = 0
+
+    @property
+    def error_rate(self) -> float:
+        return self.successes.count(False) / len(self.successes) if self.successes else 0.0
+
+    def get_latency(self, percentile: float) -> float:
+        sorted_latencies = sorted(self.latencies)
+        index = min(round(percentile / 100 * (len(sorted_latencies) - 1)), len(sorted_latencies) - 1)
+        return sorted_latencies[index]
+
+    def reset(self) -> None:
+        self.latencies.clear()
+        self.successes.clear()
+
+
+class Circuit_Breaker:
+    '''Process-wide health of the online move sources, shared by all games.
+
+    A source whose recent requests failed too often or that answered with 429 is skipped for open_time seconds
+    and then probed with a single request. A source whose p95 latency does not fit into the time budget of a
+    game is skipped by that game, but still probed once per open_time so that recoveries are noticed.'''
+
+    def __init__(self, config: dict) -> None:
+        breaker_config: dict = config.get('circuit_breaker', {})
+        self.enabled: bool = breaker_config.get('enabled', False)
+        self.min_samples: int = breaker_config.get('min_samples', 5)
+        self.max_error_rate: float = breaker_config.get('max_error_rate', 0.5)
+        self.open_time: float = breaker_config.get('open_time', 60.0)
+        self.time_fraction: float = breaker_config.get('time_fraction', 0.02)
+        window: int = breaker_config.get('window', 20)
+        self.sources: defaultdict[str, Source_Health] = defaultdict(lambda: Source_Health(window))
+        self.lock = Lock()
+
+    def get_budget(self, timeout: float, own_time: float) -> float:
+        return min(timeout, own_time * self.time_fraction)
+
+    def allow(self, source: str, budget: float) -> bool:
+        if not self.enabled:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            health = self.sources[source]
+
+            if health.state == 'half_open':
+                # The probe is still running.
+                return False
+
+            if health.state == 'open':
+                if now - health.opened_at < self.open_time:
+                    return False
+
+                print(f'Probing {source} after {now - health.opened_at:.0f} s ...')
+                health.state = 'half_open'
+            elif len(health.latencies) >= self.min_samples and health.get_latency(95) > budget:
+                if now - health.last_request < self.open_time:
+                    return False
+
+            health.last_request = now
+            return True
+
+    def get_latency(self, source: str, percentile: float = 50) -> float | None:
+        with self.lock:
+            if source not in self.sources or not self.sources[source].latencies:
+                return
+
+            return self.sources[source].get_latency(percentile)
+
+    def record(self, source: str, latency: float, success: bool) -> None:
+        # The latencies are kept while disabled as well, the move sources estimate their cost from them.
+        with self.lock:
+            health = self.sources[source]
+
+            if health.state == 'half_open':
+                if success:
+                    print(f'Closing circuit of {source}, the probe took {latency:.2f} s.')
+                    health.state = 'closed'
+                    # The samples from before the outage would open the circuit again.
+                    health.reset()
+                else:
+                    self._open(source, health, 'the probe failed')
+
+            health.latencies.append(latency)
+            health.successes.append(success)
+
+            if self.enabled and health.state == 'closed' and len(health.successes) >= self.min_samples \
+                    and health.error_rate >= self.max_error_rate:
+                self._open(source, health, f'{health.error_rate:.0%} of the recent requests failed')
+
+    def record_rate_limit(self, source: str) -> None:
+        if not self.enabled:
+            return
+
+        with self.lock:
+            health = self.sources[source]
+            health.rate_limits += 1
+            if health.state != 'open':
+                self._open(source, health, 'it is rate limited')
+
+    def __str__(self) -> str:
+        with self.lock:
+            summaries = [f'{source}: {health.get_latency(50):.2f}/{health.get_latency(95):.2f} s '
+                         f'{health.error_rate:.0%} errors {health.rate_limits} 429s {health.state}'
+                         for source, health in self.sources.items() if health.latencies]
+
+        return '     '.join(summaries) if summaries else 'No requests yet.'
+
+    def _open(self, source: str, health: Source_Health, reason: str) -> None:
+        print(f'Opening circuit of {source} for {self.open_time:.0f} s, {reason}.')
+        health.state = 'open'
+        health.opened_at = time.monotonic()
@@ -0,0 +1,189 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections.abc import Iterator
+from contextlib import ExitStack
+from heapq import merge
+from itertools import groupby
+from typing import Any, BinaryIO, TextIO
+
+import chess
+import chess.polyglot
+
+from book_index import bisect_key_left
+
+MAGIC = b'CLOUDIX1'
+MAX_PV_MOVES = 8
+# Zobrist key, depth, score, mate flag, PV length, PV moves
+RECORD_STRUCT = struct.Struct(f'>QBiBB{MAX_PV_MOVES}H')
+
+
+class Cloud_Mirror:
+    '''Memory mapped mirror of the Lichess cloud evaluations, built from the public evaluation dump.
+
+    Every position keeps only the deepest evaluation with the score and the first moves of its best PV,
+    sorted by Zobrist key, so a lookup is a single binary search. The dump only covers standard chess.'''
+
+    def __init__(self, config: dict) -> None:
+        mirror_config: dict = config.get('cloud_mirror', {})
+        self.enabled: bool = mirror_config.get('enabled', False)
+        self.path: str = mirror_config.get('path', 'cloud_mirror.idx')
+        self.min_depth: int = mirror_config.get('min_depth', 20)
+        self.low_memory: bool = mirror_config.get('low_memory', False)
+        self.mmap: mmap.mmap | None = None
+        self.size = 0
+
+        if self.enabled and os.path.isfile(self.path):
+            self._open()
+        elif self.enabled:
+            print(f'Cloud mirror "{self.path}" not found, import the evaluation dump with --import-cloud-evals.')
+
+    def get(self, board: chess.Board) -> dict[str, Any] | None:
+        if not self.mmap or board.uci_variant != 'chess' or board.chess960:
+            return
+
+        key = chess.polyglot.zobrist_hash(board)
+        index = bisect_key_left(key, self.size, lambda index: self._read_record(index)[0])
+        if index == self.size:
+            return
+
+        record_key, depth, score, is_mate, pv_length, *raw_moves = self._read_record(index)
+        if record_key != key:
+            return
+
+        pv: list[str] = []
+        replay_board = board.copy(stack=False)
+        for raw_move in raw_moves[:pv_length]:
+            move = self._decode_move(raw_move)
+            if not replay_board.is_legal(move):
+                break
+
+            pv.append(move.uci())
+            replay_board.push(move)
+
+        if not pv:
+            # Zobrist collision with a position of the dump.
+            return
+
+        return {'fen': board.fen(), 'knodes': 0, 'depth': depth,
+                'pvs': [{'moves': ' '.join(pv), 'mate' if is_mate else 'cp': score}]}
+
+    def import_dump(self, dump_path: str) -> None:
+        '''Builds the mirror from the JSONL evaluation dump, "-" reads it from stdin.
+
+        The dump is not sorted by Zobrist key, so sorted runs are written to temporary files and merged.'''
+
+        print(f'Importing cloud evaluations from "{dump_path}" ...')
+        import_start = time.perf_counter()
+        run_entries = 500_000 if self.low_memory else 10_000_000
+        if directory := os.path.dirname(self.path):
+            os.makedirs(directory, exist_ok=True)
+
+        if self.mmap:
+            self.mmap.close()
+            self.mmap = None
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(self.path) or '.') as run_directory:
+            if dump_path == '-':
+                run_paths = self._write_runs(sys.stdin, run_directory, run_entries)
+            else:
+                with open(dump_path, encoding='utf-8') as dump_file:
+                    run_paths = self._write_runs(dump_file, run_directory, run_entries)
+
+            with ExitStack() as stack:
+                run_files: list[BinaryIO] = [stack.enter_context(open(run_path, 'rb')) for run_path in run_paths]
+                position_count = self._merge_runs(run_files)
+
+        self._open()
+        print(f'Imported {position_count} positions in {time.perf_counter() - import_start:.1f} s.')
+
+    def _write_runs(self, dump_file: TextIO, run_directory: str, run_entries: int) -> list[str]:
+        run_paths: list[str] = []
+        records: list[bytes] = []
+        for line in dump_file:
+            if record := self._parse_line(line):
+                records.append(record)
+
+            if len(records) >= run_entries:
+                run_paths.append(self._write_run(records, run_directory, len(run_paths)))
+                records.clear()
+
+        if records:
+            run_paths.append(self._write_run(records, run_directory, len(run_paths)))
+
+        return run_paths
+
+    def _write_run(self, records: list[bytes], run_directory: str, run_number: int) -> str:
+        # The big-endian key comes first, so sorting the raw records sorts them by key and then by depth.
+        records.sort()
+        run_path = os.path.join(run_directory, f'{run_number}.run')
+        with open(run_path, 'wb') as run_file:
+            run_file.writelines(records)
+
+        return run_path
+
+    def _merge_runs(self, run_files: list[BinaryIO]) -> int:
+        position_count = 0
+        runs = [self._read_run(run_file) for run_file in run_files]
+        with open(f'{self.path}.tmp', 'wb') as mirror_file:
+            mirror_file.write(MAGIC)
+            for _, records in groupby(merge(*runs), key=lambda record: record[:8]):
+                # Only the deepest evaluation of a position is kept.
+                *_, deepest_record = records
+                mirror_file.write(deepest_record)
+                position_count += 1
+
+        os.replace(f'{self.path}.tmp', self.path)
+        return position_count
+
+    def _parse_line(self, line: str) -> bytes | None:
+        try:
+            position = json.loads(line)
+            evaluation = max(position['evals'], key=lambda evaluation: evaluation['depth'])
+            best_pv = evaluation['pvs'][0]
+            board = chess.Board(position['fen'])
+            raw_moves = [self._encode_move(chess.Move.from_uci(uci_move))
+                         for uci_move in best_pv['line'].split()[:MAX_PV_MOVES]]
+        except (ValueError, KeyError, IndexError):
+            return
+
+        if evaluation['depth'] < self.min_depth or not raw_moves:
+            return
+
+        is_mate = 'mate' in best_pv
+        score = best_pv['mate'] if is_mate else best_pv['cp']
+        return RECORD_STRUCT.pack(chess.polyglot.zobrist_hash(board), min(evaluation['depth'], 255), score,
+                                  is_mate, len(raw_moves), *raw_moves, *[0] * (MAX_PV_MOVES - len(raw_moves)))
+
+    def _open(self) -> None:
+        with open(self.path, 'rb') as mirror_file:
+            self.mmap = mmap.mmap(mirror_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            print(f'"{self.path}" is not a cloud mirror, import the evaluation dump again.')
+            self.mmap.close()
+            self.mmap = None
+            return
+
+        self.size = (len(self.mmap) - len(MAGIC)) // RECORD_STRUCT.size
+
+    def _read_record(self, index: int) -> tuple:
+        assert self.mmap
+        return RECORD_STRUCT.unpack_from(self.mmap, len(MAGIC) + index * RECORD_STRUCT.size)
+
+    def _encode_move(self, move: chess.Move) -> int:
+        promotion_part = move.promotion - 1 if move.promotion else 0
+        return promotion_part << 12 | move.from_square << 6 | move.to_square
+
+    def _decode_move(self, raw_move: int) -> chess.Move:
+        promotion_part = (raw_move >> 12) & 0x7
+        return chess.Move((raw_move >> 6) & 0x3f, raw_move & 0x3f, promotion_part + 1 if promotion_part else None)
+
+    @staticmethod
+    def _read_run(run_file: BinaryIO) -> Iterator[bytes]:
+        while record := run_file.read(RECORD_STRUCT.size):
+            yield record
@@ -63,6 +63,18 @@ def load_config(config_path: str) -> dict:
 
     _check_sections(config)
     _check_engines_sections(config['engines'])
+    _check_engine_pool_sections(config)
+    _check_engine_resources_sections(config)
+    _check_time_management_sections(config)
+    _check_lag_compensation_sections(config)
+    _check_online_time_budget_sections(config)
+    _check_online_cache_sections(config)
+    _check_online_prefetch_sections(config)
+    _check_hedged_search_sections(config)
+    _check_local_explorer_sections(config)
+    _check_cloud_mirror_sections(config)
+    _check_circuit_breaker_sections(config)
+    _check_source_telemetry_sections(config)
     _check_syzygy_sections(config['syzygy'])
     _check_gaviota_sections(config['gaviota'])
     _check_opening_books_sections(config['opening_books'])
@@ -119,6 +131,133 @@ def _check_engines_sections(engines_section: dict) -> None:
                 raise TypeError(f'`engines` `{key}` subsection {subsection[2]}')
 
 
+def _check_engine_pool_sections(config: dict) -> None:
+    engine_pool_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['max_idle', int, '"max_idle" must be an integer.'],
+        ['max_total_idle', int, '"max_total_idle" must be an integer.'],
+        ['idle_timeout', int, '"idle_timeout" must be an integer.']]
+    _check_optional_section(config, 'engine_pool', engine_pool_sections)
+
+
+def _check_engine_resources_sections(config: dict) -> None:
+    engine_resources_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['threads', int, '"threads" must be an integer.'],
+        ['hash', int, '"hash" must be an integer.'],
+        ['min_hash', int, '"min_hash" must be an integer.'],
+        ['cpu_affinity', bool, '"cpu_affinity" must be a bool.'],
+        ['reserved_cpus', int, '"reserved_cpus" must be an integer.']]
+    _check_optional_section(config, 'engine_resources', engine_resources_sections)
+
+
+def _check_time_management_sections(config: dict) -> None:
+    time_management_sections = [
+        ['policy', str, '"policy" must be one of "engine" or "adaptive".'],
+        ['moves_to_go', int, '"moves_to_go" must be an integer.'],
+        ['min_moves_to_go', int, '"min_moves_to_go" must be an integer.'],
+        ['max_fraction', (int, float), '"max_fraction" must be a number.'],
+        ['min_time', (int, float), '"min_time" must be a number.']]
+    _check_optional_section(config, 'time_management', time_management_sections)
+
+    if config.get('time_management', {}).get('policy', 'engine') not in ['engine', 'adaptive']:
+        raise RuntimeError('`time_management` subsection "policy" must be one of "engine" or "adaptive".')
+
+
+def _check_lag_compensation_sections(config: dict) -> None:
+    lag_compensation_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['window', int, '"window" must be an integer.'],
+        ['min_samples', int, '"min_samples" must be an integer.'],
+        ['percentile', (int, float), '"percentile" must be a number.'],
+        ['safety_margin', (int, float), '"safety_margin" must be a number.']]
+    _check_optional_section(config, 'lag_compensation', lag_compensation_sections)
+
+
+def _check_online_time_budget_sections(config: dict) -> None:
+    online_time_budget_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['fraction', (int, float), '"fraction" must be a number.'],
+        ['min_timeout', (int, float), '"min_timeout" must be a number.']]
+    _check_optional_section(config, 'online_time_budget', online_time_budget_sections)
+
+
+def _check_online_cache_sections(config: dict) -> None:
+    online_cache_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['path', str, '"path" must be a string.'],
+        ['memory_entries', int, '"memory_entries" must be an integer.'],
+        ['max_entries', int, '"max_entries" must be an integer.'],
+        ['opening_explorer_ttl', int, '"opening_explorer_ttl" must be an integer.'],
+        ['lichess_cloud_ttl', int, '"lichess_cloud_ttl" must be an integer.'],
+        ['chessdb_ttl', int, '"chessdb_ttl" must be an integer.'],
+        ['online_egtb_ttl', int, '"online_egtb_ttl" must be an integer.']]
+    _check_optional_section(config, 'online_cache', online_cache_sections)
+
+
+def _check_online_prefetch_sections(config: dict) -> None:
+    online_prefetch_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['max_replies', int, '"max_replies" must be an integer.'],
+        ['requests_per_minute', int, '"requests_per_minute" must be an integer.']]
+    _check_optional_section(config, 'online_prefetch', online_prefetch_sections)
+
+
+def _check_hedged_search_sections(config: dict) -> None:
+    hedged_search_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['window', (int, float), '"window" must be a number.']]
+    _check_optional_section(config, 'hedged_search', hedged_search_sections)
+
+
+def _check_local_explorer_sections(config: dict) -> None:
+    local_explorer_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['path', str, '"path" must be a string.'],
+        ['max_plies', int, '"max_plies" must be an integer.']]
+    _check_optional_section(config, 'local_explorer', local_explorer_sections)
+
+
+def _check_cloud_mirror_sections(config: dict) -> None:
+    cloud_mirror_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['path', str, '"path" must be a string.'],
+        ['min_depth', int, '"min_depth" must be an integer.'],
+        ['low_memory', bool, '"low_memory" must be a bool.']]
+    _check_optional_section(config, 'cloud_mirror', cloud_mirror_sections)
+
+
+def _check_circuit_breaker_sections(config: dict) -> None:
+    circuit_breaker_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['window', int, '"window" must be an integer.'],
+        ['min_samples', int, '"min_samples" must be an integer.'],
+        ['max_error_rate', (int, float), '"max_error_rate" must be a number.'],
+        ['open_time', (int, float), '"open_time" must be a number.'],
+        ['time_fraction', (int, float), '"time_fraction" must be a number.']]
+    _check_optional_section(config, 'circuit_breaker', circuit_breaker_sections)
+
+
+def _check_source_telemetry_sections(config: dict) -> None:
+    source_telemetry_sections = [
+        ['enabled', bool, '"enabled" must be a bool.'],
+        ['path', str, '"path" must be a string.']]
+    _check_optional_section(config, 'source_telemetry', source_telemetry_sections)
+
+
+def _check_optional_section(config: dict, section: str, subsections: list[list]) -> None:
+    if section not in config:
+        return
+
+    if not isinstance(config[section], dict):
+        raise TypeError(f'If uncommented, "{section}" must be a dictionary with indented keys followed by colons.')
+
+    for subsection in subsections:
+        if subsection[0] in config[section]:
+            if not isinstance(config[section][subsection[0]], subsection[1]):
+                raise TypeError(f'`{section}` subsection {subsection[2]}')
+
+
 def _check_syzygy_sections(syzygy_section: dict) -> None:
     syzygy_sections = [
         ['enabled', bool, '"enabled" must be a bool.'],
@@ -150,6 +289,9 @@ def _check_gaviota_sections(gaviota_section: dict) -> None:
         if not isinstance(gaviota_section[subsection[0]], subsection[1]):
             raise TypeError(f'`engine` `gaviota` subsection {subsection[2]}')
 
+    if not isinstance(gaviota_section.get('cache_entries', 0), int):
+        raise TypeError('`engine` `gaviota` subsection "cache_entries" must be an integer.')
+
     if gaviota_section['enabled']:
         for path in gaviota_section['paths']:
             if not os.path.isdir(path):
@@ -168,6 +310,9 @@ def _check_opening_books_sections(opening_books_section: dict) -> None:
         if not isinstance(opening_books_section[subsection[0]], subsection[1]):
             raise TypeError(f'`opening_books` subsection {subsection[2]}')
 
+    if not isinstance(opening_books_section.get('index_dir', ''), str):
+        raise TypeError('`opening_books` subsection "index_dir" must be a string.')
+
 
 def _check_online_moves_sections(online_moves_section: dict) -> None:
     online_moves_sections = [
@@ -263,6 +408,10 @@ def _init_lists(config: dict) -> None:
 
         config['blacklist'] = [username.lower() for username in config['blacklist']]
 
+    if 'move_source_plugins' in config:
+        if not isinstance(config['move_source_plugins'], list):
+            raise TypeError('If uncommented, "move_source_plugins" must be a list of module names.')
+
 
 def _check_messages(messages_section: dict) -> None:
     messages_sections = [
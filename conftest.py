@@ -0,0 +1 @@
+# Lets pytest import the modules of the bot from the tests directory.
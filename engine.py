@@ -1,26 +1,53 @@
+import asyncio
 import os
 import subprocess
+import sys
+import time
+from collections.abc import Callable
+from concurrent.futures import CancelledError, Future
+from dataclasses import replace
+from threading import Event, Lock
 
 import chess
 import chess.engine
 
+from engine_loop import Engine_Loop
+from lichess_bot_dataclasses import Crash_Statistics, Ponder_Statistics
+
+# Seconds a clock-based search may run past our remaining clock before the engine counts as hung.
+SEARCH_TIMEOUT_MARGIN = 1.0
+
 
 class Engine:
-    def __init__(self, engine: chess.engine.SimpleEngine, ponder: bool, opponent: chess.engine.Opponent) -> None:
-        self.engine = engine
+    def __init__(self, spawn: Callable[[], chess.engine.SimpleEngine], ponder: bool) -> None:
+        self.spawn = spawn
+        self.engine = spawn()
+        self.configured_ponder = ponder
         self.ponder = ponder
-        self.opponent = opponent
+        self.game: object = object()
+        self.ponder_board: chess.Board | None = None
+        self.ponder_start = 0.0
+        self.ponder_statistics = Ponder_Statistics()
+        self.resources: tuple[int, int] | None = None
+        self.opponent: chess.engine.Opponent | None = None
+        self.crash_statistics = Crash_Statistics()
+        self.cpus: set[int] | None = None
+        self.game_start = time.monotonic()
+        self.game_start_cpu_time = 0.0
+        self.search_cancelled = Event()
+        self.search_lock = Lock()
+        self.search: Future[chess.engine.PlayResult] | None = None
 
     @classmethod
-    def from_config(cls, engine_config: dict, syzygy_config: dict, opponent: chess.engine.Opponent) -> 'Engine':
+    def from_config(cls, engine_config: dict, syzygy_config: dict, engine_loop: Engine_Loop) -> 'Engine':
         engine_path, ponder, stderr, uci_options = cls._get_engine_settings(engine_config, syzygy_config)
 
-        engine = chess.engine.SimpleEngine.popen_uci(engine_path, stderr=stderr)
-
-        cls._configure_engine(engine, uci_options)
-        engine.send_opponent_information(opponent=opponent)
+        def spawn() -> chess.engine.SimpleEngine:
+            engine = engine_loop.popen_uci(engine_path, stderr)
+            cls._configure_engine(engine, uci_options)
+            return engine
 
-        return cls(engine, ponder, opponent)
+        return cls(spawn, ponder)
 
     @staticmethod
     def _get_engine_settings(engine_config: dict, syzygy_config: dict) -> tuple[str, bool, int | None, dict]:
@@ -65,40 +92,337 @@ class Engine:
     def name(self) -> str:
         return self.engine.id['name']
 
-    def make_move(self,
-                  board: chess.Board,
-                  white_time: float,
-                  black_time: float,
-                  increment: float
-                  ) -> tuple[chess.Move, chess.engine.InfoDict]:
-        if len(board.move_stack) < 2:
-            limit = chess.engine.Limit(time=15.0) if self.opponent.is_engine else chess.engine.Limit(time=5.0)
-            ponder = False
-        else:
-            limit = chess.engine.Limit(white_clock=white_time, white_inc=increment,
-                                       black_clock=black_time, black_inc=increment)
-            ponder = self.ponder
+    @property
+    def is_alive(self) -> bool:
+        return not self.engine.returncode.done()
+
+    def start_game(self, opponent: chess.engine.Opponent) -> None:
+        # A new game object makes python-chess send "ucinewgame" before the next search.
+        self.game = object()
+        self.ponder = self.configured_ponder
+        self.ponder_board = None
+        self.ponder_statistics = Ponder_Statistics()
+        self.crash_statistics = Crash_Statistics()
+        self.opponent = opponent
+        self.game_start = time.monotonic()
+        self.game_start_cpu_time = self._get_cpu_time() or 0.0
+        self.engine.send_opponent_information(opponent=opponent)
+
+    def set_resources(self, board: chess.Board, threads: int, hash_size: int) -> None:
+        self._ensure_alive()
+
+        if self.resources == (threads, hash_size):
+            return
+
+        if self._is_pondering_on(board):
+            # Reconfiguring would cancel the ponder search, the new resources are applied on a later move.
+            return
+
+        options: dict[str, int] = {}
+        if 'Threads' in self.engine.options:
+            options['Threads'] = threads
+        if 'Hash' in self.engine.options:
+            options['Hash'] = hash_size
+
+        self.engine.configure(options)
+        self.resources = threads, hash_size
+
+    def set_affinity(self, cpus: set[int]) -> None:
+        if sys.platform != 'linux' or cpus == self.cpus:
+            return
+
+        pid = self.engine.transport.get_pid()
+        try:
+            # Affinity is per thread, the search threads of the engine have to be pinned one by one.
+            for thread_id in os.listdir(f'/proc/{pid}/task'):
+                os.sched_setaffinity(int(thread_id), cpus)
+        except OSError as e:
+            print(f'Setting CPU affinity failed: {e}')
+            return
+
+        self.cpus = cpus
+
+    @property
+    def cpu_usage(self) -> tuple[float, float] | None:
+        if (cpu_time := self._get_cpu_time()) is None:
+            return
 
-        result = self.engine.play(board, limit, info=chess.engine.INFO_ALL, ponder=ponder)
+        cpu_time -= self.game_start_cpu_time
+        return cpu_time, cpu_time / max(time.monotonic() - self.game_start, 0.001)
+
+    def make_move(self, board: chess.Board, limit: chess.engine.Limit) -> tuple[chess.Move, chess.engine.InfoDict]:
+        self._ensure_alive()
+        ponder = self.ponder and len(board.move_stack) >= 2
+        search_start = time.monotonic()
+
+        self._update_ponder_statistics(board)
+        self.crash_statistics.add_search()
+        try:
+            # If the board matches the pondered position python-chess sends "ponderhit" instead of a new search.
+            result = self._play(board, limit, ponder)
+        except (TimeoutError, asyncio.TimeoutError, chess.engine.EngineError) as e:
+            print(f'Engine crashed: {e!r}')
+            self.crash_statistics.add_crash()
+            self._restart()
+
+            # The respawned engine gets the position from the board and only the time that is left.
+            ponder = False
+            limit = self._get_reduced_limit(board, limit, time.monotonic() - search_start)
+            result = self._play(board, limit, False)
 
         if not result.move:
             raise RuntimeError('Engine could not make a move!')
 
+        if ponder and result.ponder:
+            # python-chess continues with "go ponder" on the expected reply.
+            self._set_ponder_board(board, result.move, result.ponder)
+
         return result.move, result.info
 
-    def start_pondering(self, board: chess.Board) -> None:
-        if self.ponder:
-            self.engine.analysis(board)
+    def start_pondering(self, board: chess.Board, expected_move: chess.Move | None, limit: chess.engine.Limit) -> None:
+        if not self.ponder:
+            return
+
+        try:
+            self._ensure_alive()
+        except (OSError, TimeoutError, chess.engine.EngineError) as e:
+            print(f'Pondering skipped: {e!r}')
+            return
+
+        if expected_move is None or expected_move not in board.legal_moves:
+            # Without a guess there is nothing to ponder on, the next search starts from scratch.
+            self.ponder_board = None
+            return
+
+        ponder_board = board.copy()
+        ponder_board.push(expected_move)
+        self.engine.communicate(lambda protocol: Ponder_Command(protocol, ponder_board, limit, self.game))
+        self.ponder_board = ponder_board
+        self.ponder_start = time.perf_counter()
 
     def stop_pondering(self) -> None:
         if self.ponder:
             self.ponder = False
-            self.engine.analysis(chess.Board(), chess.engine.Limit(time=0.001))
+            self.ponder_board = None
+            self.stop()
+
+    def _ensure_alive(self) -> None:
+        if not self.is_alive:
+            print('Engine process died.')
+            self.crash_statistics.add_crash()
+            self._restart()
+
+    def _restart(self) -> None:
+        restart_start = time.monotonic()
+        self.engine.close()
+        self.engine = self.spawn()
+        self.ponder_board = None
+        # CPU time of the crashed process is lost.
+        self.game_start_cpu_time = 0.0
+
+        if self.resources:
+            threads, hash_size = self.resources
+            self.resources = None
+            self.set_resources(chess.Board(), threads, hash_size)
+
+        if self.cpus:
+            cpus = self.cpus
+            self.cpus = None
+            self.set_affinity(cpus)
+
+        if self.opponent:
+            self.engine.send_opponent_information(opponent=self.opponent)
+
+        restart_time = time.monotonic() - restart_start
+        self.crash_statistics.add_restart(restart_time)
+        print(f'Engine restarted in {restart_time:.2f} s.')
+
+    def _play(self, board: chess.Board, limit: chess.engine.Limit, ponder: bool) -> chess.engine.PlayResult:
+        protocol = self.engine.protocol
+        with self.search_lock:
+            if self.search_cancelled.is_set():
+                raise CancelledError('The search was cancelled before it started.')
+
+            # SimpleEngine.play only has a timeout for searches with a fixed move time.
+            coroutine = asyncio.wait_for(protocol.play(board, limit, game=self.game, info=chess.engine.INFO_ALL,
+                                                       ponder=ponder),
+                                         self._get_search_timeout(board, limit))
+            search = self.search = asyncio.run_coroutine_threadsafe(coroutine, protocol.loop)
+
+        try:
+            result = search.result()
+        finally:
+            with self.search_lock:
+                self.search = None
+
+        if self.search_cancelled.is_set():
+            raise CancelledError('The search was cancelled after it finished.')
+
+        return result
+
+    def _get_search_timeout(self, board: chess.Board, limit: chess.engine.Limit) -> float | None:
+        if self.engine.timeout is None:
+            return
+
+        if limit.time is not None:
+            return limit.time + self.engine.timeout
+
+        own_clock = limit.white_clock if board.turn else limit.black_clock
+        if own_clock is None:
+            return
+
+        # A search that outlasts our whole clock can only come from a hung engine.
+        return own_clock + SEARCH_TIMEOUT_MARGIN
+
+    def _get_reduced_limit(self,
+                           board: chess.Board,
+                           limit: chess.engine.Limit,
+                           elapsed: float
+                           ) -> chess.engine.Limit:
+        if limit.time is not None:
+            return replace(limit, time=max(limit.time - elapsed, 0.1))
+
+        own_clock = limit.white_clock if board.turn else limit.black_clock
+        if own_clock is None:
+            return limit
+
+        own_clock = max(own_clock - elapsed, 0.1)
+        # Caps the new search at a small share of the remaining clock instead of leaving it to the engine.
+        if board.turn:
+            return replace(limit, white_clock=own_clock, time=own_clock / 20)
+
+        return replace(limit, black_clock=own_clock, time=own_clock / 20)
+
+    def _get_cpu_time(self) -> float | None:
+        if sys.platform != 'linux':
+            return
+
+        try:
+            with open(f'/proc/{self.engine.transport.get_pid()}/stat', encoding='utf-8') as stat_file:
+                # The process name may contain spaces, utime and stime follow after it.
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, ValueError, IndexError):
+            return
+
+    def _set_ponder_board(self, board: chess.Board, move: chess.Move, ponder_move: chess.Move) -> None:
+        self.ponder_board = board.copy()
+        self.ponder_board.push(move)
+        self.ponder_board.push(ponder_move)
+        self.ponder_start = time.perf_counter()
+
+    def _is_pondering_on(self, board: chess.Board) -> bool:
+        if self.ponder_board is None:
+            return False
+
+        return board == self.ponder_board and board.move_stack == self.ponder_board.move_stack
+
+    def _update_ponder_statistics(self, board: chess.Board) -> None:
+        if self.ponder_board is None:
+            return
+
+        if self._is_pondering_on(board):
+            self.ponder_statistics.add_hit(time.perf_counter() - self.ponder_start)
+        else:
+            self.ponder_statistics.add_miss()
+
+        self.ponder_board = None
+
+    def stop(self) -> None:
+        # Any new command cancels a running search or ponder command.
+        self.engine.ping()
+
+    def cancel_search(self) -> None:
+        '''Cancels the search of make_move running in another thread, make_move then raises CancelledError.
+
+        A search that has not been sent to the engine yet is skipped. The event has to be cleared before the
+        next search that may be cancelled is started.'''
+
+        with self.search_lock:
+            self.search_cancelled.set()
+            if self.search:
+                # The play command of python-chess sends "stop" when its result is cancelled.
+                self.search.cancel()
 
     def close(self) -> None:
         try:
             self.engine.quit()
-        except TimeoutError:
+        except (TimeoutError, chess.engine.EngineTerminatedError):
             print('Engine could not be terminated cleanly.')
 
         self.engine.close()
+
+
+class Ponder_Command(chess.engine.BaseCommand[chess.engine.Protocol, None]):
+    '''Runs "go ponder" on a position chosen by the bot, e.g. the expected reply to a book move.
+
+    Mirrors the pondering part of python-chess' play command, so that the next play() on the same
+    position is answered with "ponderhit" instead of a new search.'''
+
+    # The UCI helpers of the protocol are the same python-chess uses for its own commands.
+    # pylint: disable=protected-access
+
+    def __init__(self,
+                 engine: chess.engine.Protocol,
+                 board: chess.Board,
+                 limit: chess.engine.Limit,
+                 game: object
+                 ) -> None:
+        super().__init__(engine)
+        assert isinstance(engine, chess.engine.UciProtocol)
+        self.uci = engine
+        self.board = board
+        self.limit = limit
+        self.game = game
+        self.sent_isready = False
+        self.is_searching = False
+
+    def start(self, engine: chess.engine.Protocol) -> None:
+        if 'UCI_AnalyseMode' in self.uci.options and 'UCI_AnalyseMode' not in self.uci.target_config:
+            self.uci._setoption('UCI_AnalyseMode', False)
+        if 'Ponder' in self.uci.options:
+            self.uci._setoption('Ponder', True)
+        if 'MultiPV' in self.uci.options:
+            self.uci._setoption('MultiPV', self.uci.options['MultiPV'].default)
+
+        if self.uci.first_game or self.uci.game != self.game:
+            self.uci.game = self.game
+            self.uci._ucinewgame()
+            self.sent_isready = True
+            self.uci._isready()
+        else:
+            self._go()
+
+        self.result.set_result(None)
+
+    def line_received(self, engine: chess.engine.Protocol, line: str) -> None:
+        if line == 'readyok' and self.sent_isready:
+            self.sent_isready = False
+            if self.state == chess.engine.CommandState.CANCELLING:
+                self._end()
+            else:
+                self._go()
+        elif line.startswith('bestmove'):
+            self._end()
+
+    def cancel(self, engine: chess.engine.Protocol) -> None:
+        if not self.is_searching:
+            if not self.sent_isready:
+                self._end()
+            return
+
+        may_ponderhit = self.uci.may_ponderhit
+        if may_ponderhit and may_ponderhit.move_stack == self.board.move_stack and may_ponderhit == self.board:
+            self.uci.ponderhit = True
+            self._end()
+        else:
+            self.uci.send_line('stop')
+
+    def _end(self) -> None:
+        self.uci.may_ponderhit = None
+        self.set_finished()
+
+    def _go(self) -> None:
+        self.is_searching = True
+        self.uci._position(self.board)
+        self.uci._go(self.limit, ponder=True)
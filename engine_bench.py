@@ -0,0 +1,159 @@
+import os
+import time
+from dataclasses import dataclass
+from threading import Thread
+
+import chess
+import chess.engine
+import yaml
+
+from engine import Engine
+from engine_loop import Engine_Loop
+
+BENCH_POSITIONS = [
+    chess.STARTING_FEN,
+    'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'r2q1rk1/pp2bppp/2n1bn2/3p4/3P4/2NBBN2/PP3PPP/R2Q1RK1 w - - 6 11',
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1'
+]
+BENCH_DEPTH = 16
+HASH_SIZES = [16, 64, 256]
+MIN_EFFICIENCY = 0.7
+
+
+@dataclass
+class Bench_Result:
+    threads: int
+    hash_size: int
+    concurrency: int
+    nps: float
+    time_to_depth: float
+
+    def __str__(self) -> str:
+        return (f'Threads: {self.threads:3}     Hash: {self.hash_size:5} MB     Concurrency: {self.concurrency:3}     '
+                f'NPS: {self.nps / 1000:9.1f} k     Time to depth {BENCH_DEPTH}: {self.time_to_depth:6.2f} s')
+
+
+class Engine_Bench:
+    '''Runs every configured engine over a fixed set of positions to size Threads and Hash for this host.'''
+
+    def __init__(self, config: dict) -> None:
+        self.config = config
+        self.cpu_count = os.cpu_count() or 1
+        self.concurrency: int = config['challenge'].get('concurrency', 1)
+        self.engine_loop = Engine_Loop()
+
+    def run(self, output_path: str | None) -> None:
+        print(f'Benchmarking on {self.cpu_count} CPUs for {self.concurrency} concurrent games ...')
+        recommendations: dict[str, dict] = {}
+
+        for engine_key, engine_config in self.config['engines'].items():
+            print(f'\nEngine "{engine_key}":')
+            try:
+                recommendations[engine_key] = {'uci_options': self._bench_engine(engine_config)}
+            except (OSError, TimeoutError, chess.engine.EngineError) as e:
+                print(f'Benchmarking engine "{engine_key}" failed: {e}')
+
+        self.engine_loop.close()
+
+        recommended_config = yaml.safe_dump({'engines': recommendations}, sort_keys=False)
+        print(f'\nRecommended settings:\n{recommended_config}')
+
+        if output_path:
+            with open(output_path, 'w', encoding='utf-8') as output:
+                output.write(recommended_config)
+            print(f'Recommended settings written to "{output_path}".')
+
+    def _bench_engine(self, engine_config: dict) -> dict[str, int]:
+        default_hash = engine_config['uci_options'].get('Hash', 64)
+
+        thread_results = [self._bench(engine_config, threads, default_hash, 1)
+                          for threads in self._get_levels(self.cpu_count)]
+        base_nps = thread_results[0].nps
+        for result in thread_results:
+            self._print_result(result, result.nps / (result.threads * base_nps) if base_nps else 0.0)
+
+        threads = self._get_recommended_threads(thread_results, base_nps)
+
+        hash_results = [self._bench(engine_config, threads, hash_size, 1) for hash_size in HASH_SIZES]
+        for result in hash_results:
+            self._print_result(result, None)
+
+        # The smallest hash table within 5 % of the fastest time to depth.
+        fastest = min(result.time_to_depth for result in hash_results)
+        hash_size = min(result.hash_size for result in hash_results if result.time_to_depth <= fastest * 1.05)
+
+        single_nps = next(result.nps for result in hash_results if result.hash_size == hash_size)
+        for concurrency in self._get_levels(max(self.cpu_count // threads, 1))[1:]:
+            result = self._bench(engine_config, threads, hash_size, concurrency)
+            self._print_result(result, result.nps / (concurrency * single_nps) if single_nps else 0.0)
+
+        return {'Threads': threads, 'Hash': hash_size}
+
+    def _get_recommended_threads(self, results: list[Bench_Result], base_nps: float) -> int:
+        max_threads = max(self.cpu_count // self.concurrency, 1)
+        threads = 1
+        for result in results:
+            if result.threads > max_threads:
+                break
+
+            if base_nps and result.nps / (result.threads * base_nps) >= MIN_EFFICIENCY:
+                threads = result.threads
+
+        return threads
+
+    def _bench(self, engine_config: dict, threads: int, hash_size: int, concurrency: int) -> Bench_Result:
+        engines = [Engine.from_config(engine_config, self.config['syzygy'], self.engine_loop)
+                   for _ in range(concurrency)]
+        results: list[tuple[int, float]] = [(0, 0.0)] * concurrency
+
+        def search(index: int) -> None:
+            results[index] = self._search_positions(engines[index])
+
+        try:
+            for engine in engines:
+                engine.set_resources(chess.Board(), threads, hash_size)
+
+            start = time.perf_counter()
+            search_threads = [Thread(target=search, args=(index,)) for index in range(concurrency)]
+            for search_thread in search_threads:
+                search_thread.start()
+            for search_thread in search_threads:
+                search_thread.join()
+            wall_time = time.perf_counter() - start
+        finally:
+            for engine in engines:
+                engine.close()
+
+        nodes = sum(result[0] for result in results)
+        time_to_depth = sum(result[1] for result in results) / concurrency / len(BENCH_POSITIONS)
+        return Bench_Result(threads, hash_size, concurrency, nodes / wall_time if wall_time else 0.0, time_to_depth)
+
+    def _search_positions(self, engine: Engine) -> tuple[int, float]:
+        nodes = 0
+        search_time = 0.0
+
+        for fen in BENCH_POSITIONS:
+            start = time.perf_counter()
+            # A new game object clears the hash table between the positions.
+            info = engine.engine.analyse(chess.Board(fen), chess.engine.Limit(depth=BENCH_DEPTH), game=object())
+            search_time += time.perf_counter() - start
+            nodes += info.get('nodes', 0)
+
+        return nodes, search_time
+
+    def _get_levels(self, maximum: int) -> list[int]:
+        levels = [1]
+        while levels[-1] * 2 <= maximum:
+            levels.append(levels[-1] * 2)
+
+        if levels[-1] != maximum:
+            levels.append(maximum)
+
+        return levels
+
+    def _print_result(self, result: Bench_Result, efficiency: float | None) -> None:
+        efficiency_str = f'     Efficiency: {efficiency * 100:5.1f} %' if efficiency is not None else ''
+        print(f'{result}{efficiency_str}')
@@ -0,0 +1,49 @@
+import asyncio
+from threading import Thread
+
+import chess.engine
+
+
+class Engine_Loop:
+    '''Drives all engine processes from a single asyncio event loop in one background thread.
+
+    The returned chess.engine.SimpleEngine objects are thread-safe facades on this loop, so the game threads
+    keep their blocking interface without python-chess starting a thread and event loop per engine.'''
+
+    def __init__(self) -> None:
+        if not isinstance(asyncio.get_event_loop_policy(), chess.engine.EventLoopPolicy):
+            asyncio.set_event_loop_policy(chess.engine.EventLoopPolicy())
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._run, name='Engine loop', daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        # Attaches the child watcher of the python-chess event loop policy to this loop.
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def popen_uci(self, command: str, stderr: int | None, timeout: float = 10.0) -> chess.engine.SimpleEngine:
+        future = asyncio.run_coroutine_threadsafe(self._popen_uci(command, stderr, timeout), self.loop)
+        return future.result()
+
+    def close(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def _popen_uci(self, command: str, stderr: int | None, timeout: float) -> chess.engine.SimpleEngine:
+        transport, protocol = await chess.engine.UciProtocol.popen(command, stderr=stderr)
+        engine = chess.engine.SimpleEngine(transport, protocol, timeout=timeout)
+
+        try:
+            await asyncio.wait_for(protocol.initialize(), timeout)
+        except BaseException:
+            engine.close()
+            raise
+
+        def on_exit(returncode: asyncio.Future[int]) -> None:
+            engine.returncode.set_result(returncode.result())
+            engine.close()
+
+        protocol.returncode.add_done_callback(on_exit)
+        return engine
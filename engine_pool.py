@@ -0,0 +1,223 @@
+import time
+from collections import defaultdict
+from threading import Condition, Lock, Thread
+
+import chess
+import chess.engine
+from chess.variant import find_variant
+
+from engine import Engine
+from engine_loop import Engine_Loop
+from enums import Challenge_Color, Variant
+from lichess_bot_dataclasses import Crash_Statistics, Ponder_Statistics
+from resource_allocator import Resource_Allocator
+
+
+class Engine_Pool:
+    def __init__(self, config: dict) -> None:
+        self.engines_config: dict[str, dict] = config['engines']
+        self.syzygy_config: dict = config['syzygy']
+        pool_config: dict = config.get('engine_pool', {})
+        self.enabled: bool = pool_config.get('enabled', True)
+        self.max_idle: int = pool_config.get('max_idle', 1) if self.enabled else 0
+        self.max_total_idle: int = pool_config.get('max_total_idle', 2) if self.enabled else 0
+        self.idle_timeout: float = pool_config.get('idle_timeout', 600)
+        self.idle_engines: defaultdict[str, list[tuple[Engine, float]]] = defaultdict(list)
+        self.expected_games: defaultdict[str, int] = defaultdict(int)
+        self.warming_engines: defaultdict[str, int] = defaultdict(int)
+        self.random_color_keys: list[set[str]] = []
+        self.lock = Lock()
+        self.warmed_up = Condition(self.lock)
+        self.ponder_statistics = Ponder_Statistics()
+        self.crash_statistics: defaultdict[str, Crash_Statistics] = defaultdict(Crash_Statistics)
+        self.resource_allocator = Resource_Allocator(config)
+        self.engine_loop = Engine_Loop()
+
+    def acquire(self, key: str, opponent: chess.engine.Opponent) -> Engine:
+        with self.lock:
+            self._drop_expectation(key)
+
+        engine = self._get_idle_engine(key) or self._create_engine(key)
+        engine.start_game(opponent)
+        return engine
+
+    def prewarm(self, variant: Variant, speed: str, color: Challenge_Color) -> None:
+        if color == Challenge_Color.RANDOM:
+            keys = {self.get_engine_key(variant, speed, True), self.get_engine_key(variant, speed, False)}
+        else:
+            keys = {self.get_engine_key(variant, speed, color == Challenge_Color.WHITE)}
+
+        if len(keys) > 1:
+            with self.lock:
+                # Only one of the keys is used, the other expectation is dropped when the game starts.
+                self.random_color_keys.append(keys)
+
+        for key in keys:
+            with self.lock:
+                self.expected_games[key] += 1
+                if len(self.idle_engines[key]) + self.warming_engines[key] >= self.expected_games[key]:
+                    continue
+
+                if not self._has_idle_capacity(key):
+                    continue
+
+                self.warming_engines[key] += 1
+
+            Thread(target=self._warm_up, args=(key,), daemon=True).start()
+
+    def get_engine_key(self, variant: Variant, speed: str, is_white: bool) -> str:
+        color = 'white' if is_white else 'black'
+
+        if variant == Variant.CHESS960:
+            if f'chess960_{color}' in self.engines_config:
+                return f'chess960_{color}'
+
+            if 'chess960' in self.engines_config:
+                return 'chess960'
+
+        elif variant in [Variant.STANDARD, Variant.FROM_POSITION]:
+            if f'{speed}_{color}' in self.engines_config:
+                return f'{speed}_{color}'
+
+            if speed in self.engines_config:
+                return speed
+
+        else:
+            VariantBoard = find_variant(variant.value)
+            for alias in [alias.lower() for alias in VariantBoard.aliases]:
+                if f'{alias}_{color}' in self.engines_config:
+                    return f'{alias}_{color}'
+
+                if alias in self.engines_config:
+                    return alias
+
+            if f'variants_{color}' in self.engines_config:
+                return f'variants_{color}'
+
+            if 'variants' in self.engines_config:
+                return 'variants'
+
+        if f'standard_{color}' in self.engines_config:
+            return f'standard_{color}'
+
+        if 'standard' in self.engines_config:
+            return 'standard'
+
+        raise RuntimeError(f'No suitable engine for "{variant.value}" configured.')
+
+    def release(self, key: str, engine: Engine) -> None:
+        with self.lock:
+            self.ponder_statistics.merge(engine.ponder_statistics)
+            self.crash_statistics[key].merge(engine.crash_statistics)
+
+        if not self._is_healthy(engine):
+            engine.close()
+            return
+
+        with self.lock:
+            if len(self.idle_engines[key]) < self.max_idle and self._total_idle < self.max_total_idle:
+                self.idle_engines[key].append((engine, time.monotonic()))
+                return
+
+        engine.close()
+
+    def evict_idle(self) -> None:
+        expired_engines: list[Engine] = []
+        deadline = time.monotonic() - self.idle_timeout
+
+        with self.lock:
+            for key, idle_engines in self.idle_engines.items():
+                if any(idle_since < deadline for _, idle_since in idle_engines):
+                    # Warm engines of games that never started expire as well.
+                    self.expected_games[key] = 0
+                    self.random_color_keys = [keys for keys in self.random_color_keys if key not in keys]
+
+                expired_engines.extend(engine for engine, idle_since in idle_engines if idle_since < deadline)
+                self.idle_engines[key] = [(engine, idle_since)
+                                          for engine, idle_since in idle_engines
+                                          if idle_since >= deadline]
+
+        for engine in expired_engines:
+            engine.close()
+
+    def close(self) -> None:
+        with self.lock:
+            idle_engines = [engine for engines in self.idle_engines.values() for engine, _ in engines]
+            self.idle_engines.clear()
+
+        for engine in idle_engines:
+            engine.close()
+
+        self.engine_loop.close()
+
+    @property
+    def _total_idle(self) -> int:
+        return sum(len(idle_engines) for idle_engines in self.idle_engines.values())
+
+    def _has_idle_capacity(self, key: str) -> bool:
+        # Warming engines take an idle slot as soon as they are ready.
+        warming_count = sum(self.warming_engines.values())
+        return (len(self.idle_engines[key]) + self.warming_engines[key] < self.max_idle
+                and self._total_idle + warming_count < self.max_total_idle)
+
+    def _drop_expectation(self, key: str) -> None:
+        if self.expected_games[key]:
+            self.expected_games[key] -= 1
+
+        for keys in self.random_color_keys:
+            if key in keys:
+                self.random_color_keys.remove(keys)
+                for unused_key in keys - {key}:
+                    if self.expected_games[unused_key]:
+                        self.expected_games[unused_key] -= 1
+                return
+
+    def _get_idle_engine(self, key: str) -> Engine | None:
+        while True:
+            with self.lock:
+                self.warmed_up.wait_for(lambda: self.idle_engines[key] or not self.warming_engines[key], 30.0)
+                if not self.idle_engines[key]:
+                    return
+
+                engine, _ = self.idle_engines[key].pop()
+
+            if self._is_healthy(engine):
+                return engine
+
+            print(f'Discarding unresponsive "{key}" engine.')
+            engine.close()
+
+    def _create_engine(self, key: str) -> Engine:
+        return Engine.from_config(self.engines_config[key], self.syzygy_config, self.engine_loop)
+
+    def _warm_up(self, key: str) -> None:
+        try:
+            engine = self._create_engine(key)
+            engine.stop()
+        except (OSError, TimeoutError, chess.engine.EngineError) as e:
+            print(f'Warming up "{key}" engine failed: {e}')
+            with self.lock:
+                self.warming_engines[key] -= 1
+                self.warmed_up.notify_all()
+            return
+
+        with self.lock:
+            self.warming_engines[key] -= 1
+            # Engines released in the meantime may have filled the pool.
+            is_parked = len(self.idle_engines[key]) < self.max_idle and self._total_idle < self.max_total_idle
+            if is_parked:
+                self.idle_engines[key].append((engine, time.monotonic()))
+            self.warmed_up.notify_all()
+
+        if not is_parked:
+            engine.close()
+
+    def _is_healthy(self, engine: Engine) -> bool:
+        if not engine.is_alive:
+            return False
+
+        try:
+            engine.stop()
+            return True
+        except (TimeoutError, chess.engine.EngineError):
+            return False
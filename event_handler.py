@@ -47,7 +47,7 @@ class Event_Handler(Thread):
                     self.api.decline_challenge(challenge_id, decline_reason)
                     continue
 
-                self.game_manager.add_challenge(challenge_id)
+                self.game_manager.add_challenge(challenge_id, event['challenge'])
                 print('The challenge is added to the queue.')
                 print(128 * '‾')
             elif event['type'] == 'gameStart':
@@ -1,3 +1,4 @@
+import time
 from datetime import datetime, timedelta
 from queue import Queue
 from threading import Event, Thread
@@ -5,11 +6,22 @@ from threading import Event, Thread
 from api import API
 from lichess_bot_dataclasses import Game_Information
 from chatter import Chatter
+from engine_pool import Engine_Pool
+from handle_registry import Handle_Registry
 from lichess_game import Lichess_Game
 
 
 class Game(Thread):
-    def __init__(self, config: dict, api: API, game_id: str, game_finished_event: Event, game_queue: Queue) -> None:
+    def __init__(self,
+                 config: dict,
+                 api: API,
+                 game_id: str,
+                 game_finished_event: Event,
+                 game_queue: Queue,
+                 *,
+                 engine_pool: Engine_Pool,
+                 handle_registry: Handle_Registry
+                 ) -> None:
         Thread.__init__(self)
         self.config = config
         self.api = api
@@ -18,7 +30,7 @@ class Game(Thread):
         self.game_queue = game_queue
 
         self.game_info = Game_Information.from_gameFull_event(self.game_queue.get())
-        self.lichess_game = Lichess_Game(self.api, self.game_info, self.config)
+        self.lichess_game = Lichess_Game(self.api, self.game_info, self.config, engine_pool, handle_registry)
         self.chatter = Chatter(self.api, self.config, self.game_info, self.lichess_game)
 
     def start(self):
@@ -31,7 +43,7 @@ class Game(Thread):
         if self.game_info.state['status'] != 'started':
             self._print_result_message(self.game_info.state)
             self.chatter.send_goodbyes()
-            self.lichess_game.end_game()
+            self.lichess_game.end_game(self.game_info.state)
             return
 
         if self.lichess_game.is_our_turn:
@@ -54,7 +66,8 @@ class Game(Thread):
 
             if event['type'] == 'gameFull':
                 if event['state']['status'] != 'started':
-                    self._print_result_message(event['state'])
+                    game_state = event['state']
+                    self._print_result_message(game_state)
                     self.chatter.send_goodbyes()
                     break
 
@@ -64,13 +77,14 @@ class Game(Thread):
                     self.lichess_game.start_pondering()
             elif event['type'] == 'gameState':
                 if event['status'] != 'started':
-                    self._print_result_message(event)
+                    game_state = event
+                    self._print_result_message(game_state)
                     self.chatter.send_goodbyes()
                     break
 
                 self.lichess_game.update(event)
 
-                if self.lichess_game.is_our_turn and not self.lichess_game.board.is_repetition():
+                if self.lichess_game.is_our_turn and not self.lichess_game.is_repetition:
                     self._make_move()
             elif event['type'] == 'chatLine':
                 self.chatter.handle_chat_message(event)
@@ -81,7 +95,7 @@ class Game(Thread):
             else:
                 print(event)
 
-        self.lichess_game.end_game()
+        self.lichess_game.end_game(game_state)
         self.game_finished_event.set()
 
     def _make_move(self) -> None:
@@ -89,7 +103,9 @@ class Game(Thread):
         if resign:
             self.api.resign_game(self.game_id)
         else:
+            send_start = time.monotonic()
             self.api.send_move(self.game_id, uci_move, offer_draw)
+            self.lichess_game.record_move_sent(send_start)
             self.chatter.print_eval()
 
     def _print_game_information(self) -> None:
@@ -127,7 +143,7 @@ class Game(Thread):
             if game_state['status'] == 'draw':
                 if self.lichess_game.board.is_fifty_moves():
                     message = 'Game drawn by 50-move rule.'
-                elif self.lichess_game.board.is_repetition():
+                elif self.lichess_game.is_repetition:
                     message = 'Game drawn by threefold repetition.'
                 elif self.lichess_game.board.is_insufficient_material():
                     message = 'Game drawn due to insufficient material.'
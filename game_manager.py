@@ -7,8 +7,12 @@ from aliases import Challenge_ID, Game_ID
 from api import API
 from lichess_bot_dataclasses import Challenge_Request
 from challenger import Challenger
+from enums import Challenge_Color, Variant
+from engine_pool import Engine_Pool
+from handle_registry import Handle_Registry
 from game import Game
 from matchmaking import Matchmaking
+from move_sources import load_move_source_plugins
 from pending_challenge import Pending_Challenge
 
 
@@ -20,6 +24,7 @@ class Game_Manager(Thread):
         self.is_running = True
         self.games: dict[Game_ID, Game] = {}
         self.open_challenge_ids: deque[Challenge_ID] = deque()
+        self.open_challenges: dict[Challenge_ID, dict] = {}
         self.reserved_game_spots = 0
         self.started_game_ids: deque[Game_ID] = deque()
         self.challenge_requests: deque[Challenge_Request] = deque()
@@ -31,6 +36,11 @@ class Game_Manager(Thread):
         self.next_matchmaking = datetime.max
         self.matchmaking_delay = timedelta(seconds=config['matchmaking'].get('delay', 10))
         self.concurrency: int = config['challenge'].get('concurrency', 1)
+        self.engine_pool = Engine_Pool(config)
+        self.handle_registry = Handle_Registry()
+        load_move_source_plugins(config)
+        if config['opening_books']['enabled']:
+            self.handle_registry.prepare_book_indexes(config['opening_books'])
 
     def start(self):
         Thread.start(self)
@@ -44,6 +54,7 @@ class Game_Manager(Thread):
             event_received = self.changed_event.wait(1.0)
             if not event_received:
                 self._check_matchmaking()
+                self.engine_pool.evict_idle()
                 continue
 
             self.changed_event.clear()
@@ -56,8 +67,8 @@ class Game_Manager(Thread):
             while challenge_request := self._get_next_challenge_request():
                 self._create_challenge(challenge_request)
 
-            while challenge_id := self._get_next_challenge_id():
-                self._accept_challenge(challenge_id)
+            while next_challenge := self._get_next_challenge():
+                self._accept_challenge(*next_challenge)
 
         for game_id, game in self.games.items():
             game.join()
@@ -65,9 +76,13 @@ class Game_Manager(Thread):
             if game_id == self.current_matchmaking_game_id:
                 self.matchmaking.on_game_finished(game)
 
-    def add_challenge(self, challenge_id: Challenge_ID) -> None:
+        self.engine_pool.close()
+        self.handle_registry.close()
+
+    def add_challenge(self, challenge_id: Challenge_ID, challenge: dict) -> None:
         if challenge_id not in self.open_challenge_ids:
             self.open_challenge_ids.append(challenge_id)
+            self.open_challenges[challenge_id] = challenge
             self.changed_event.set()
 
     def request_challenge(self, *challenge_requests: Challenge_Request) -> None:
@@ -77,6 +92,7 @@ class Game_Manager(Thread):
     def remove_challenge(self, challenge_id: Challenge_ID) -> None:
         if challenge_id in self.open_challenge_ids:
             self.open_challenge_ids.remove(challenge_id)
+            self.open_challenges.pop(challenge_id, None)
             self.changed_event.set()
 
     def on_game_started(self, game_id: Game_ID) -> None:
@@ -116,6 +132,7 @@ class Game_Manager(Thread):
             self._delay_matchmaking(self.matchmaking_delay)
 
             del self.games[game_id]
+            self.engine_pool.resource_allocator.remove_game(game_id)
 
     def _start_game(self, game_id: Game_ID) -> None:
         if game_id in self.games:
@@ -130,29 +147,35 @@ class Game_Manager(Thread):
             self.api.abort_game(game_id)
             return
 
+        self.engine_pool.resource_allocator.add_game(game_id)
         game_queue = Queue()
         Thread(target=self.api.get_game_stream, args=(game_id, game_queue), daemon=True).start()
 
-        self.games[game_id] = Game(self.config, self.api, game_id, self.changed_event, game_queue)
+        self.games[game_id] = Game(self.config, self.api, game_id, self.changed_event, game_queue,
+                                   engine_pool=self.engine_pool, handle_registry=self.handle_registry)
         self.games[game_id].start()
 
     def _finish_game(self, game_id: Game_ID) -> None:
         self.games[game_id].join()
         del self.games[game_id]
 
-    def _get_next_challenge_id(self) -> Challenge_ID | None:
+    def _get_next_challenge(self) -> tuple[Challenge_ID, dict | None] | None:
         if not self.open_challenge_ids:
             return
 
         if len(self.games) + self.reserved_game_spots >= self.concurrency:
             return
 
-        return self.open_challenge_ids.popleft()
+        # The challenge leaves the queue whether it can be accepted or not.
+        challenge_id = self.open_challenge_ids.popleft()
+        return challenge_id, self.open_challenges.pop(challenge_id, None)
 
-    def _accept_challenge(self, challenge_id: Challenge_ID) -> None:
+    def _accept_challenge(self, challenge_id: Challenge_ID, challenge: dict | None) -> None:
         if self.api.accept_challenge(challenge_id):
             # Reserve a spot for this game
             self.reserved_game_spots += 1
+            if challenge:
+                self._prewarm_engine(challenge)
         else:
             print(f'Challenge "{challenge_id}" could not be accepted!')
 
@@ -178,6 +201,8 @@ class Game_Manager(Thread):
         if success:
             # Reserve a spot for this game
             self.reserved_game_spots += 1
+            if self.matchmaking.last_challenge_request:
+                self._prewarm_engine_for_request(self.matchmaking.last_challenge_request)
         else:
             self.current_matchmaking_game_id = None
             if has_reached_rate_limit:
@@ -207,6 +232,7 @@ class Game_Manager(Thread):
         if last_response.success:
             # Reserve a spot for this game
             self.reserved_game_spots += 1
+            self._prewarm_engine_for_request(challenge_request)
         elif last_response.has_reached_rate_limit and self.challenge_requests:
             print('Challenge queue cleared due to rate limiting.')
             self.challenge_requests.clear()
@@ -214,3 +240,17 @@ class Game_Manager(Thread):
             print(f'Challenges against {challenge_request.opponent_username} removed from queue.')
             while challenge_request in self.challenge_requests:
                 self.challenge_requests.remove(challenge_request)
+
+    def _prewarm_engine(self, challenge: dict) -> None:
+        challenger_color = challenge.get('finalColor', challenge['color'])
+        if challenger_color == 'white':
+            color = Challenge_Color.BLACK
+        elif challenger_color == 'black':
+            color = Challenge_Color.WHITE
+        else:
+            color = Challenge_Color.RANDOM
+
+        self.engine_pool.prewarm(Variant(challenge['variant']['key']), challenge['speed'], color)
+
+    def _prewarm_engine_for_request(self, challenge_request: Challenge_Request) -> None:
+        self.engine_pool.prewarm(challenge_request.variant, challenge_request.speed, challenge_request.color)
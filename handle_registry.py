@@ -0,0 +1,128 @@
+import os
+from collections import OrderedDict, defaultdict
+from collections.abc import Callable
+from threading import Lock
+from typing import Any, TypeVar
+
+import chess
+import chess.gaviota
+import chess.polyglot
+import chess.syzygy
+
+from book_index import Book_Index
+from lichess_bot_dataclasses import Cache_Statistics
+
+Handle = TypeVar('Handle')
+
+
+class Shared_Gaviota_Tablebase:
+    '''Gaviota tablebase shared by all games with an LRU cache of the probe results.
+
+    The probes are serialized, the readers of the tablebase keep file positions and block caches.'''
+
+    def __init__(self,
+                 tablebase: chess.gaviota.PythonTablebase | chess.gaviota.NativeTablebase,
+                 cache_entries: int
+                 ) -> None:
+        self.tablebase = tablebase
+        self.cache_entries = cache_entries
+        self.cache: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self.cache_statistics = Cache_Statistics()
+        self.lock = Lock()
+
+    def probe_dtm(self, board: chess.Board) -> int:
+        return self._probe('dtm', board)
+
+    def probe_wdl(self, board: chess.Board) -> int:
+        return self._probe('wdl', board)
+
+    def close(self) -> None:
+        with self.lock:
+            self.tablebase.close()
+
+    def _probe(self, kind: str, board: chess.Board) -> int:
+        key = kind, chess.polyglot.zobrist_hash(board)
+
+        with self.lock:
+            if (value := self.cache.get(key)) is not None:
+                self.cache.move_to_end(key)
+                self.cache_statistics.add_hit()
+                return value
+
+            self.cache_statistics.add_miss()
+            value = self.tablebase.probe_dtm(board) if kind == 'dtm' else self.tablebase.probe_wdl(board)
+
+            self.cache[key] = value
+            if len(self.cache) > self.cache_entries:
+                self.cache.popitem(last=False)
+
+            return value
+
+
+class Handle_Registry:
+    '''Opens every opening book index and tablebase directory once per process and shares it between the games.
+
+    Book indexes are memory mapped and the Syzygy tablebases lock internally, so both can be probed from
+    several games at once. The handles stay open between games and are closed on shutdown.'''
+
+    def __init__(self) -> None:
+        self.handles: dict[tuple, Any] = {}
+        self.reference_counts: defaultdict[tuple, int] = defaultdict(int)
+        self.lock = Lock()
+
+    def acquire_book_index(self, opening_books_config: dict, key: str) -> Book_Index:
+        index_path = os.path.join(opening_books_config.get('index_dir', 'book_indexes'), f'{key}.idx')
+        books: dict[str, str] = opening_books_config['books'][key]['names']
+        return self._acquire(('book index', index_path), lambda: Book_Index.open(index_path, books))
+
+    def prepare_book_indexes(self, opening_books_config: dict) -> None:
+        # Building an index can take a while, so it is done before the first game instead of during it.
+        for key in opening_books_config['books']:
+            self.release(self.acquire_book_index(opening_books_config, key))
+
+    def acquire_syzygy(self, paths: list[str], variant_board: type[chess.Board]) -> chess.syzygy.Tablebase:
+        def open_tablebase() -> chess.syzygy.Tablebase:
+            tablebase = chess.syzygy.open_tablebase(paths[0], VariantBoard=variant_board)
+            for path in paths[1:]:
+                tablebase.add_directory(path)
+
+            return tablebase
+
+        # The variant rules are part of the probing code, every variant needs its own tablebase.
+        return self._acquire(('syzygy', variant_board.uci_variant, *paths), open_tablebase)
+
+    def acquire_gaviota(self, paths: list[str], cache_entries: int) -> Shared_Gaviota_Tablebase:
+        def open_tablebase() -> Shared_Gaviota_Tablebase:
+            tablebase = chess.gaviota.open_tablebase(paths[0])
+            for path in paths[1:]:
+                tablebase.add_directory(path)
+
+            return Shared_Gaviota_Tablebase(tablebase, cache_entries)
+
+        return self._acquire(('gaviota', *paths), open_tablebase)
+
+    def release(self, handle: Any) -> None:
+        with self.lock:
+            for key, shared_handle in self.handles.items():
+                if shared_handle is handle:
+                    self.reference_counts[key] -= 1
+                    return
+
+    def close(self) -> None:
+        with self.lock:
+            for key, handle in self.handles.items():
+                if self.reference_counts[key]:
+                    print(f'Closing {key[0]} "{key[-1]}" while still in use by {self.reference_counts[key]} games.')
+
+                handle.close()
+
+            self.handles.clear()
+            self.reference_counts.clear()
+
+    def _acquire(self, key: tuple, open_handle: Callable[[], Handle]) -> Handle:
+        with self.lock:
+            if key not in self.handles:
+                self.handles[key] = open_handle()
+
+            self.reference_counts[key] += 1
+            return self.handles[key]
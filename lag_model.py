@@ -0,0 +1,93 @@
+import time
+from collections import deque
+from threading import Lock
+
+
+class Lag_Model:
+    '''Rolling model of the time the server charges us beyond our own thinking time.
+
+    Every sample consists of the local think time (gameState received until move chosen), the round-trip
+    time of sending the move and the lag, i.e. the difference between the time the server took from our
+    clock and our think time. The move overhead is derived from a high percentile of the lag.'''
+
+    def __init__(self, config: dict) -> None:
+        lag_config: dict = config.get('lag_compensation', {})
+        self.enabled: bool = lag_config.get('enabled', True)
+        self.min_samples: int = lag_config.get('min_samples', 10)
+        self.percentile: float = lag_config.get('percentile', 95)
+        self.safety_margin: float = lag_config.get('safety_margin', 0.2)
+        window: int = lag_config.get('window', 100)
+        self.think_times: deque[float] = deque(maxlen=window)
+        self.send_times: deque[float] = deque(maxlen=window)
+        self.lags: deque[float] = deque(maxlen=window)
+        self.lock = Lock()
+
+    def add_sample(self, think_time: float, send_time: float, lag: float) -> None:
+        with self.lock:
+            self.think_times.append(think_time)
+            self.send_times.append(send_time)
+            self.lags.append(lag)
+
+    def get_move_overhead(self, default: float) -> float:
+        if not self.enabled:
+            return default
+
+        with self.lock:
+            if len(self.lags) < self.min_samples:
+                return default
+
+            lag = self._get_percentile(self.lags, self.percentile)
+
+        # Lichess compensates part of the lag, so the measured lag can be negative.
+        return max(lag, 0.0) + self.safety_margin
+
+    def __str__(self) -> str:
+        with self.lock:
+            if not self.lags:
+                return 'No samples yet.'
+
+            distributions = [(name, self._get_percentile(samples, 50), self._get_percentile(samples, self.percentile))
+                             for name, samples in [('Think', self.think_times),
+                                                   ('Send', self.send_times),
+                                                   ('Lag', self.lags)]]
+            sample_count = len(self.lags)
+
+        percentiles = '     '.join(f'{name}: {median:.2f}/{high:.2f} s' for name, median, high in distributions)
+        return f'{percentiles} (p50/p{self.percentile:g} of {sample_count} moves)'
+
+    def _get_percentile(self, samples: deque[float], percentile: float) -> float:
+        sorted_samples = sorted(samples)
+        index = min(round(percentile / 100 * (len(sorted_samples) - 1)), len(sorted_samples) - 1)
+        return sorted_samples[index]
+
+
+class Move_Timer:
+    '''Times the moves of a single game and feeds the measured lag into the lag model.'''
+
+    def __init__(self, lag_model: Lag_Model, own_clock: float) -> None:
+        self.lag_model = lag_model
+        self.turn_start = time.monotonic()
+        self.turn_clock = own_clock
+        self.move_timing: tuple[float, float] | None = None
+
+    @property
+    def is_waiting_for_clock(self) -> bool:
+        return self.move_timing is not None
+
+    def start_turn(self, own_clock: float) -> None:
+        self.turn_start = time.monotonic()
+        self.turn_clock = own_clock
+
+    def move_sent(self, send_start: float) -> None:
+        self.move_timing = send_start - self.turn_start, time.monotonic() - send_start
+
+    def record(self, own_clock: float, increment: float, is_measurable: bool) -> None:
+        if self.move_timing is None:
+            return
+
+        think_time, send_time = self.move_timing
+        self.move_timing = None
+
+        if is_measurable:
+            charged_time = self.turn_clock + increment - own_clock
+            self.lag_model.add_sample(think_time, send_time, charged_time - think_time)
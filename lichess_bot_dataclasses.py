@@ -1,13 +1,18 @@
+from bisect import bisect_left
+from collections.abc import Callable
 from dataclasses import dataclass, field
 from datetime import timedelta
 
 import chess
 import chess.engine
-from chess.polyglot import MemoryMappedReader
 
 from aliases import Challenge_ID, Has_Reached_Rate_Limit, Is_Misconfigured, No_Opponent, Success
+from book_index import Book_Index
 from enums import Challenge_Color, Variant, Perf_Type
 
+# Upper bounds in seconds of the latency histogram of the move sources, the last bucket is unbounded.
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
 
 @dataclass
 class API_Challenge_Reponse:
@@ -49,6 +54,23 @@ class Challenge_Request:
 
         return NotImplemented
 
+    @property
+    def speed(self) -> str:
+        estimated_game_duration = self.initial_time + self.increment * 40
+        if estimated_game_duration < 30:
+            return "ultraBullet"
+
+        if estimated_game_duration < 180:
+            return "bullet"
+
+        if estimated_game_duration < 480:
+            return "blitz"
+
+        if estimated_game_duration < 1500:
+            return "rapid"
+
+        return "classical"
+
 
 @dataclass
 class Chat_Message:
@@ -187,7 +209,7 @@ class Game_Information:
 class Book_Settings:
     selection: str = ""
     max_depth: int = 600
-    readers: dict[str, MemoryMappedReader] = field(default_factory=dict)
+    index: Book_Index | None = None
 
 
 @dataclass
@@ -235,3 +257,164 @@ class Move_Response:
     is_drawish: bool = field(default=False, kw_only=True)
     is_resignable: bool = field(default=False, kw_only=True)
     is_engine_move: bool = field(default=False, kw_only=True)
+
+
+@dataclass
+class Online_Request:
+    source: str
+    request: Callable[[], dict | None]
+    timeout: float
+    params: str = ""
+
+
+@dataclass
+class Ponder_Statistics:
+    ponders: int = 0
+    hits: int = 0
+    time_saved: float = 0.0
+
+    def add_hit(self, time_saved: float) -> None:
+        self.ponders += 1
+        self.hits += 1
+        self.time_saved += time_saved
+
+    def add_miss(self) -> None:
+        self.ponders += 1
+
+    def merge(self, other: "Ponder_Statistics") -> None:
+        self.ponders += other.ponders
+        self.hits += other.hits
+        self.time_saved += other.time_saved
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.ponders * 100.0 if self.ponders else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.hits}/{self.ponders} hits ({self.hit_rate:.1f} %), {self.time_saved:.1f} s saved"
+
+
+@dataclass
+class Source_Statistics:
+    attempts: int = 0
+    hits: int = 0
+    latency: float = 0.0
+    time_saved: float = 0.0
+    latency_histogram: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+
+    def add_hit(self, latency: float, time_saved: float) -> None:
+        self.hits += 1
+        self._add_attempt(latency, time_saved)
+
+    def add_miss(self, latency: float, time_lost: float) -> None:
+        self._add_attempt(latency, -time_lost)
+
+    def merge(self, other: "Source_Statistics") -> None:
+        self.attempts += other.attempts
+        self.hits += other.hits
+        self.latency += other.latency
+        self.time_saved += other.time_saved
+        self.latency_histogram = [count + other_count
+                                  for count, other_count in zip(self.latency_histogram, other.latency_histogram)]
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.attempts * 100.0 if self.attempts else 0.0
+
+    @property
+    def average_latency(self) -> float:
+        return self.latency / self.attempts if self.attempts else 0.0
+
+    def get_latency(self, percentile: float) -> float:
+        # The upper bound of the histogram bucket that contains the percentile.
+        count = 0
+        for bucket, bucket_count in zip((*LATENCY_BUCKETS, float("inf")), self.latency_histogram):
+            count += bucket_count
+            if count and count >= percentile / 100.0 * self.attempts:
+                return bucket
+
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {"attempts": self.attempts,
+                "hits": self.hits,
+                "latency": round(self.latency, 3),
+                "time_saved": round(self.time_saved, 3),
+                "latency_histogram": dict(zip([*map(str, LATENCY_BUCKETS), "inf"], self.latency_histogram)),
+                "hit_rate": round(self.hit_rate, 1),
+                "average_latency": round(self.average_latency, 3),
+                "p50_latency": self.get_latency(50),
+                "p95_latency": self.get_latency(95)}
+
+    @classmethod
+    def from_dict(cls, dict_: dict) -> "Source_Statistics":
+        histogram = dict_.get("latency_histogram", {})
+        return cls(dict_.get("attempts", 0), dict_.get("hits", 0), dict_.get("latency", 0.0),
+                   dict_.get("time_saved", 0.0),
+                   [histogram.get(bucket, 0) for bucket in [*map(str, LATENCY_BUCKETS), "inf"]])
+
+    def _add_attempt(self, latency: float, time_saved: float) -> None:
+        self.attempts += 1
+        self.latency += latency
+        self.time_saved += time_saved
+        self.latency_histogram[bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+    def __str__(self) -> str:
+        return (f"{self.hits}/{self.attempts} hits ({self.hit_rate:.1f} %), "
+                f"{self.average_latency:.2f}/{self.get_latency(95):.2f} s latency, {self.time_saved:.1f} s saved")
+
+
+@dataclass
+class Cache_Statistics:
+    lookups: int = 0
+    hits: int = 0
+
+    def add_hit(self) -> None:
+        self.lookups += 1
+        self.hits += 1
+
+    def add_miss(self) -> None:
+        self.lookups += 1
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups * 100.0 if self.lookups else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.hits}/{self.lookups} hits ({self.hit_rate:.1f} %)"
+
+
+@dataclass
+class Crash_Statistics:
+    searches: int = 0
+    crashes: int = 0
+    restarts: int = 0
+    restart_time: float = 0.0
+
+    def add_search(self) -> None:
+        self.searches += 1
+
+    def add_crash(self) -> None:
+        self.crashes += 1
+
+    def add_restart(self, restart_time: float) -> None:
+        self.restarts += 1
+        self.restart_time += restart_time
+
+    def merge(self, other: "Crash_Statistics") -> None:
+        self.searches += other.searches
+        self.crashes += other.crashes
+        self.restarts += other.restarts
+        self.restart_time += other.restart_time
+
+    @property
+    def crash_rate(self) -> float:
+        return self.crashes / self.searches * 100.0 if self.searches else 0.0
+
+    @property
+    def average_restart_time(self) -> float:
+        return self.restart_time / self.restarts if self.restarts else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.crashes} crashes in {self.searches} searches ({self.crash_rate:.2f} %), "
+                f"{self.restarts} restarts ({self.average_restart_time:.2f} s average)")
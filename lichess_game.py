@@ -1,25 +1,37 @@
-import random
-from collections.abc import Callable
+import time
+from collections import defaultdict
+from concurrent.futures import (FIRST_COMPLETED, CancelledError, Future, ThreadPoolExecutor,
+                                TimeoutError as FutureTimeoutError, wait)
 from itertools import islice
 
 import chess
 import chess.engine
-import chess.gaviota
-import chess.polyglot
-import chess.syzygy
 from chess.variant import find_variant
 
-from aliases import DTM, DTZ, Offer_Draw, Outcome, Performance, Resign, UCI_Move
+from aliases import DTM, DTZ, Offer_Draw, Outcome, Resign, UCI_Move
 from api import API
-from lichess_bot_dataclasses import Book_Settings, Game_Information, Move_Response
-from engine import Engine
+from lag_model import Move_Timer
+from lichess_bot_dataclasses import Game_Information, Move_Response, Online_Request, Source_Statistics
+from engine_pool import Engine_Pool
+from handle_registry import Handle_Registry
+from move_sources import MOVE_SOURCES, Move_Source, Online_Move_Source
+from repetition_tracker import Repetition_Tracker
+from time_manager import Time_Manager
 from enums import Variant
 
 
 class Lichess_Game:
-    def __init__(self, api: API, game_information: Game_Information, config: dict) -> None:
+    def __init__(self,
+                 api: API,
+                 game_information: Game_Information,
+                 config: dict,
+                 engine_pool: Engine_Pool,
+                 handle_registry: Handle_Registry
+                 ) -> None:
         self.config = config
         self.api = api
+        self.engine_pool = engine_pool
+        self.handle_registry = handle_registry
         self.game_info = game_information
         self.board = self._setup_board()
         self.white_time: float = self.game_info.state['wtime'] / 1000
@@ -28,47 +40,56 @@ class Lichess_Game:
         self.is_white: bool = self.game_info.white_name == config['username']
         self.draw_enabled: bool = config['offer_draw']['enabled']
         self.resign_enabled: bool = config['resign']['enabled']
-        self.move_overhead = self._get_move_overhead()
-        self.book_settings = self._get_book_settings()
-        self.syzygy_tablebase = self._get_syzygy_tablebase()
-        self.gaviota_tablebase = self._get_gaviota_tablebase()
+        self.move_timer = Move_Timer(api.lag_model, self.own_time)
         self.move_sources = self._get_move_sources()
+        self.source_statistics: defaultdict[str, Source_Statistics] = defaultdict(Source_Statistics)
+        self.repetition_tracker = Repetition_Tracker(self.board)
+        self.pending_online_responses: dict[str, tuple[Future[dict | None], float]] = {}
+        prefetch_config: dict = config.get('online_prefetch', {})
+        self.prefetch_max_replies: int = (prefetch_config.get('max_replies', 3)
+                                          if prefetch_config.get('enabled', False) else 0)
 
-        self.out_of_book_counter = 0
-        self.opening_explorer_counter = 0
-        self.out_of_opening_explorer_counter = 0
-        self.cloud_counter = 0
-        self.out_of_cloud_counter = 0
-        self.chessdb_counter = 0
-        self.out_of_chessdb_counter = 0
         opponent = self.game_info.black_opponent if self.is_white else self.game_info.white_opponent
-        self.engine = Engine.from_config(config['engines'][self._get_engine_key()], config['syzygy'], opponent)
+        self.engine_key = self.engine_pool.get_engine_key(self.game_info.variant, self.game_info.speed, self.is_white)
+        self.engine = self.engine_pool.acquire(self.engine_key, opponent)
+        self.time_manager = Time_Manager.from_config(config, self.is_white, bool(opponent.is_engine))
+        self.last_move_by_engine = False
         self.scores: list[chess.engine.PovScore | None] = []
         self.last_message = 'No eval available yet.'
         self.last_pv: list[chess.Move] = []
 
     def make_move(self) -> tuple[UCI_Move, Offer_Draw, Resign]:
+        hedged_sources = self._get_hedged_sources()
+        deadline = self._get_source_deadline()
+        online_requested = False
         for move_source in self.move_sources:
-            if move_response := move_source():
+            if isinstance(move_source, Online_Move_Source) and not online_requested:
+                # All online sources are queried at once, their answers are still used in order of priority.
+                self._request_online_responses()
+                online_requested = True
+
+            if move_source in hedged_sources:
+                continue
+
+            if move_response := self._propose(move_source, time.monotonic(), deadline, self._get_engine_move_time()):
                 break
         else:
-            move, info = self.engine.make_move(self.board, *self.engine_times)
-
-            self.scores.append(info.get('score'))
-            message = f'Engine:  {self._format_move(move):14} {self._format_engine_info(info)}'
-            move_response = Move_Response(move, message,
-                                          pv=info.get('pv', []),
-                                          is_drawish=self._is_draw_eval(),
-                                          is_resignable=self._is_resign_eval(),
-                                          is_engine_move=len(self.board.move_stack) > 1)
+            if hedged_sources and self.pending_online_responses:
+                move_response = self._make_hedged_move(hedged_sources)
+            else:
+                move_response = self._make_engine_move()
 
-        self.board.push(move_response.move)
+        self._cancel_online_requests()
+        self.repetition_tracker.push(self.board, move_response.move)
+        self.last_move_by_engine = move_response.is_engine_move
+        self.last_message = move_response.public_message
+        self.last_pv = move_response.pv
         if not move_response.is_engine_move:
-            self.engine.start_pondering(self.board)
+            self.start_pondering()
+
+        self.prefetch_online_responses()
 
         print(f'{move_response.public_message} {move_response.private_message}'.strip())
-        self.last_message = move_response.public_message
-        self.last_pv = move_response.pv
 
         return (move_response.move.uci(),
                 self._offer_draw(move_response.is_drawish),
@@ -76,17 +97,28 @@ class Lichess_Game:
 
     def update(self, gameState_event: dict) -> None:
         moves = gameState_event['moves'].split()
+        if self.move_timer.is_waiting_for_clock and len(moves) >= len(self.board.move_stack):
+            self._record_lag(gameState_event)
+
         if len(moves) <= len(self.board.move_stack):
             return
 
-        self.board.push(chess.Move.from_uci(moves[-1]))
+        self.repetition_tracker.push(self.board, chess.Move.from_uci(moves[-1]))
         self.white_time = gameState_event['wtime'] / 1000
         self.black_time = gameState_event['btime'] / 1000
+        self.move_timer.start_turn(self.own_time)
+
+    def record_move_sent(self, send_start: float) -> None:
+        self.move_timer.move_sent(send_start)
 
     @property
     def is_our_turn(self) -> bool:
         return self.is_white == self.board.turn
 
+    @property
+    def is_repetition(self) -> bool:
+        return self.repetition_tracker.is_repetition(self.board)
+
     @property
     def is_abortable(self) -> bool:
         return len(self.board.move_stack) < 2
@@ -99,37 +131,63 @@ class Lichess_Game:
     def opponent_time(self) -> float:
         return self.black_time if self.is_white else self.white_time
 
-    @property
-    def engine_times(self) -> tuple[float, float, float]:
-        if self.is_white:
-            if self.white_time > self.move_overhead:
-                white_time = self.white_time - self.move_overhead
-            else:
-                white_time = self.white_time / 2
+    def start_pondering(self) -> None:
+        expected_move = None
+        if len(self.last_pv) > 1 and self.board.move_stack and self.board.peek() == self.last_pv[0]:
+            expected_move = self.last_pv[1]
 
-            return white_time, self.black_time, self.increment
+        self.engine.start_pondering(self.board, expected_move, self._get_limit())
 
-        if self.black_time > self.move_overhead:
-            black_time = self.black_time - self.move_overhead
-        else:
-            black_time = self.black_time / 2
+    def prefetch_online_responses(self) -> None:
+        if not self.prefetch_max_replies:
+            return
 
-        return self.white_time, black_time, self.increment
+        for reply in self._get_expected_replies():
+            board = self.board.copy(stack=False)
+            board.push(reply)
 
-    def start_pondering(self) -> None:
-        self.engine.start_pondering(self.board)
+            for online_source in self._get_online_sources():
+                if not online_source.is_prefetched:
+                    continue
+
+                if not (online_request := online_source.get_online_request(board)):
+                    continue
 
-    def end_game(self) -> None:
-        self.engine.close()
+                if not self.api.online_cache.is_enabled(online_request.source):
+                    continue
 
-        for book_reader in self.book_settings.readers.values():
-            book_reader.close()
+                if self.api.online_cache.get(online_request.source, board, online_request.params):
+                    continue
 
-        if self.syzygy_tablebase:
-            self.syzygy_tablebase.close()
+                if self.api.prefetch_rate_limiter.try_acquire(online_request.source):
+                    self.api.prefetch_executor.submit(self._fetch_online_response, online_request, board)
 
-        if self.gaviota_tablebase:
-            self.gaviota_tablebase.close()
+    def end_game(self, game_state: dict) -> None:
+        self.api.local_explorer.add_game(self.board, self.is_white, self.game_info, game_state)
+        ponder_statistics = self.engine.ponder_statistics
+        crash_statistics = self.engine.crash_statistics
+        cpu_usage = self.engine.cpu_usage
+        self.engine_pool.release(self.engine_key, self.engine)
+
+        if self.engine.configured_ponder:
+            print(f'Ponder: {ponder_statistics}     Lifetime: {self.engine_pool.ponder_statistics}')
+
+        if crash_statistics.crashes:
+            print(f'Crashes: {crash_statistics}     Lifetime: {self.engine_pool.crash_statistics[self.engine_key]}')
+
+        if cpu_usage:
+            cpus_str = f' on CPUs {", ".join(map(str, sorted(self.engine.cpus)))}' if self.engine.cpus else ''
+            print(f'CPU: {cpu_usage[0]:.1f} s{cpus_str} ({cpu_usage[1]:.2f} cores average)')
+
+        print(f'Latency: {self.api.lag_model}     Move overhead: {self._get_current_move_overhead():.2f} s')
+        print(f'Online sources: {self.api.circuit_breaker}')
+        for source, statistics in self.source_statistics.items():
+            print(f'{source:17} {statistics}')
+
+        self.api.source_telemetry.add_game(self.source_statistics)
+
+        for move_source in self.move_sources:
+            move_source.close()
 
     def _is_draw_eval(self) -> bool:
         if not self.draw_enabled:
@@ -190,415 +248,165 @@ class Lichess_Game:
 
         return True
 
-    def _make_book_move(self) -> Move_Response | None:
-        out_of_book = self.out_of_book_counter >= 10
-        too_deep = self.board.ply() >= self.book_settings.max_depth
-
-        if out_of_book or too_deep:
+    def _make_engine_move(self) -> Move_Response:
+        self._assign_engine_resources()
+        return self._get_engine_move_response(*self.engine.make_move(self.board, self._get_limit()))
+
+    def _make_hedged_move(self, hedged_sources: list[Online_Move_Source]) -> Move_Response:
+        hedge_start = time.monotonic()
+        window_end = hedge_start + self.config.get('hedged_search', {}).get('window', 1.0)
+        engine_move_time = self._get_engine_move_time()
+        hedged_responses: dict[Online_Move_Source, Future[dict | None]] = {}
+        for move_source in hedged_sources:
+            if online_request := move_source.get_online_request(self.board):
+                if pending_response := self.pending_online_responses.get(online_request.source):
+                    hedged_responses[move_source] = pending_response[0]
+
+        self._assign_engine_resources()
+        self.engine.search_cancelled.clear()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='Hedged search') as executor:
+            # The search runs on a copy, formatting the online moves pushes and pops moves on the board.
+            search = executor.submit(self._search_hedged, self.board.copy(), self._get_limit())
+
+            while hedged_responses and not search.done() and (timeout := window_end - time.monotonic()) > 0:
+                futures: list[Future] = [search, *hedged_responses.values()]
+                wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for move_source in [move_source for move_source, future in hedged_responses.items() if future.done()]:
+                    del hedged_responses[move_source]
+                    # The engine searches while the game waits, a miss costs no clock.
+                    if move_response := self._propose(move_source, hedge_start, window_end, engine_move_time,
+                                                      costs_clock=False):
+                        if not search.done():
+                            # A search that has not reached the engine yet is skipped, a running one is stopped.
+                            self.engine.cancel_search()
+                            wait([search])
+                        return move_response
+
+            for move_source, future in hedged_responses.items():
+                # The search finished first, requests that are already running still fill the cache.
+                future.cancel()
+                self.source_statistics[move_source.name].add_miss(time.monotonic() - hedge_start, 0.0)
+
+            engine_move = search.result()
+            assert engine_move, 'Only searches that lost against an online move are cancelled.'
+            return self._get_engine_move_response(*engine_move)
+
+    def _search_hedged(self,
+                       board: chess.Board,
+                       limit: chess.engine.Limit
+                       ) -> tuple[chess.Move, chess.engine.InfoDict] | None:
+        try:
+            return self.engine.make_move(board, limit)
+        except CancelledError:
+            # An online move won the race, the move of the engine is not needed anymore.
             return
 
-        read_learn = self.config['opening_books'].get('read_learn')
-        for name, book_reader in self.book_settings.readers.items():
-            entries = list(book_reader.find_all(self.board))
-            if entries:
-                if self.book_settings.selection == 'weighted_random':
-                    entry, = random.choices(entries, [entry.weight for entry in entries])
-                elif self.book_settings.selection == 'uniform_random':
-                    entry = random.choice(entries)
-                else:
-                    entry = max(entries, key=lambda entry: entry.weight)
-
-                if not self._is_repetition(entry.move):
-                    self.out_of_book_counter = 0
-                    weight = entry.weight / sum(entry.weight for entry in entries) * 100.0
-                    learn = entry.learn if read_learn else 0
-                    name = name if len(self.book_settings.readers) > 1 else ''
-                    public_message = f'Book:    {self._format_move(entry.move):14}'
-                    private_message = f'{self._format_book_info(weight, learn)}     {name}'
-                    return Move_Response(entry.move, public_message, private_message=private_message)
-
-        self.out_of_book_counter += 1
-
-    def _get_book_settings(self) -> Book_Settings:
-        enabled = self.config['opening_books']['enabled']
-
-        if not enabled:
-            return Book_Settings()
-
-        key = self._get_book_key()
-        if not key:
-            return Book_Settings()
-
-        return Book_Settings(self.config['opening_books']['books'][key]['selection'],
-                             self.config['opening_books']['books'][key].get('max_depth', 600),
-                             {name: chess.polyglot.open_reader(path)
-                              for name, path in self.config['opening_books']['books'][key]['names'].items()})
-
-    def _get_book_key(self) -> str | None:
-        books: dict[str, dict] = self.config['opening_books']['books']
-        color = 'white' if self.is_white else 'black'
-
-        if self.board.uci_variant != 'chess':
-            for alias in [alias.lower() for alias in self.board.aliases]:
-                if f'{alias}_{color}' in books:
-                    return f'{alias}_{color}'
-
-                if alias in books:
-                    return alias
-
+    def _assign_engine_resources(self) -> None:
+        if resources := self.engine_pool.resource_allocator.get_resources(self.game_info.id_, self.own_time):
+            self.engine.set_resources(self.board, *resources)
+
+        if cpus := self.engine_pool.resource_allocator.get_cpus(self.game_info.id_):
+            self.engine.set_affinity(cpus)
+
+    def _get_engine_move_response(self, move: chess.Move, info: chess.engine.InfoDict) -> Move_Response:
+        self.scores.append(info.get('score'))
+        message = f'Engine:  {self.format_move(move):14} {self._format_engine_info(info)}'
+        return Move_Response(move, message,
+                             pv=info.get('pv', []),
+                             is_drawish=self._is_draw_eval(),
+                             is_resignable=self._is_resign_eval(),
+                             is_engine_move=len(self.board.move_stack) > 1)
+
+    def _propose(self,
+                 move_source: Move_Source,
+                 propose_start: float,
+                 deadline: float,
+                 engine_move_time: float,
+                 *,
+                 costs_clock: bool = True
+                 ) -> Move_Response | None:
+        if not move_source.is_applicable(self.board):
             return
 
-        if self.board.chess960:
-            if f'chess960_{color}' in books:
-                return f'chess960_{color}'
-
-            if 'chess960' in books:
-                return 'chess960'
-
+        move_response = move_source.propose(self.board, deadline)
+        latency = time.monotonic() - propose_start
+        # Without an engine move time the clock is not running yet.
+        if move_response:
+            self.source_statistics[move_source.name].add_hit(latency,
+                                                             engine_move_time - latency if engine_move_time else 0.0)
         else:
-            if f'{self.game_info.speed}_{color}' in books:
-                return f'{self.game_info.speed}_{color}'
-
-            if self.game_info.speed in books:
-                return self.game_info.speed
-
-        if f'standard_{color}' in books:
-            return f'standard_{color}'
-
-        if 'standard' in books:
-            return 'standard'
+            self.source_statistics[move_source.name].add_miss(latency,
+                                                              latency if costs_clock and engine_move_time else 0.0)
 
-        return
-
-    def _make_opening_explorer_move(self) -> Move_Response | None:
-        out_of_book = self.out_of_opening_explorer_counter >= 5
-        max_depth = self.config['online_moves']['opening_explorer'].get('max_depth', float('inf'))
-        too_deep = self.board.ply() >= max_depth
-        max_moves = self.config['online_moves']['opening_explorer'].get('max_moves', float('inf'))
-        too_many_moves = self.opening_explorer_counter >= max_moves
-        has_time = self._has_time(self.config['online_moves']['opening_explorer']['min_time'])
-
-        if out_of_book or too_deep or too_many_moves or not has_time:
-            return
-
-        timeout = self.config['online_moves']['opening_explorer']['timeout']
-        min_games = max(self.config['online_moves']['opening_explorer']['min_games'], 1)
-        only_with_wins = self.config['online_moves']['opening_explorer']['only_with_wins']
-        anti = self.config['online_moves']['opening_explorer']['anti']
-
-        if anti:
-            color = 'black' if self.board.turn else 'white'
-            username = self.game_info.black_name if self.board.turn else self.game_info.white_name
-        else:
-            color = 'white' if self.board.turn else 'black'
-            username = self.game_info.white_name if self.board.turn else self.game_info.black_name
-
-        if response := self.api.get_opening_explorer(username,
-                                                     self.board.fen(),
-                                                     self.game_info.variant,
-                                                     color,
-                                                     timeout):
-            game_count = response['white'] + response['draws'] + response['black']
-            if game_count >= min_games:
-                top_move = self._get_opening_explorer_top_move(response['moves'])
-                missing_win = only_with_wins and not bool(top_move['wins'])
-                if not missing_win:
-                    self.out_of_opening_explorer_counter = 0
-                    move = chess.Move.from_uci(top_move['uci'])
-                    if not self._is_repetition(move):
-                        self.opening_explorer_counter += 1
-                        message = f'Explore: {self._format_move(move):14} Performance: {top_move["performance"]}' \
-                                  f'WDL: {top_move["wins"]}/{top_move["draws"]}/{top_move["losses"]}'
-                        return Move_Response(move, message)
-
-            self.out_of_opening_explorer_counter += 1
-        else:
-            self._reduce_own_time(timeout)
+        return move_response
 
-    def _get_opening_explorer_top_move(self, moves: list[dict]) -> dict:
-        selection = self.config['online_moves']['opening_explorer']['selection']
-        anti = self.config['online_moves']['opening_explorer']['anti']
+    def _get_expected_replies(self) -> list[chess.Move]:
+        replies: list[chess.Move] = []
 
-        if selection == 'win_rate':
-            for move in moves:
-                move['wins'] = move['white'] if self.board.turn else move['black']
-                move['losses'] = move['black'] if self.board.turn else move['white']
+        if len(self.last_pv) > 1 and self.board.move_stack and self.board.peek() == self.last_pv[0]:
+            replies.append(self.last_pv[1])
 
-            def win_performance(move: dict):
-                return (move['wins'] - move['losses']) / (move['white'] + move['draws'] + move['black'])
-
-            return max(moves, key=win_performance)
-
-        min_or_max = min if anti else max
-        top_move = min_or_max(moves, key=lambda move: move['performance'])
-        top_move['wins'] = top_move['white'] if self.board.turn else top_move['black']
-        top_move['losses'] = top_move['black'] if self.board.turn else top_move['white']
-        return top_move
-
-    def _make_cloud_move(self) -> Move_Response | None:
-        out_of_book = self.out_of_cloud_counter >= 5
-        max_depth = self.config['online_moves']['lichess_cloud'].get('max_depth', float('inf'))
-        too_deep = self.board.ply() >= max_depth
-        max_moves = self.config['online_moves']['lichess_cloud'].get('max_moves', float('inf'))
-        too_many_moves = self.cloud_counter >= max_moves
-        has_time = self._has_time(self.config['online_moves']['lichess_cloud']['min_time'])
-
-        if out_of_book or too_deep or too_many_moves or not has_time:
-            return
-
-        timeout = self.config['online_moves']['lichess_cloud']['timeout']
-        min_eval_depth = self.config['online_moves']['lichess_cloud']['min_eval_depth']
-
-        if response := self.api.get_cloud_eval(
-                self.board.fen().replace('[', '/').replace(']', ''),
-                self.game_info.variant, timeout):
-            if 'error' not in response:
-                if response['depth'] >= min_eval_depth:
-                    self.out_of_cloud_counter = 0
-                    pv = [chess.Move.from_uci(uci_move) for uci_move in response['pvs'][0]['moves'].split()]
-                    if not self._is_repetition(pv[0]):
-                        self.cloud_counter += 1
-                        pov_score = chess.engine.PovScore(chess.engine.Cp(response['pvs'][0]['cp']), chess.WHITE)
-                        message = f'Cloud:   {self._format_move(pv[0]):14} {self._format_score(pov_score)}' \
-                                  f'Depth: {response["depth"]}'
-                        return Move_Response(pv[0], message, pv=pv)
-
-            self.out_of_cloud_counter += 1
-        else:
-            self._reduce_own_time(timeout)
-
-    def _make_chessdb_move(self) -> Move_Response | None:
-        out_of_book = self.out_of_chessdb_counter >= 5
-        max_depth = self.config['online_moves']['chessdb'].get('max_depth', float('inf'))
-        too_deep = self.board.ply() >= max_depth
-        max_moves = self.config['online_moves']['chessdb'].get('max_moves', float('inf'))
-        too_many_moves = self.chessdb_counter >= max_moves
-        has_time = self._has_time(self.config['online_moves']['chessdb']['min_time'])
-        is_endgame = chess.popcount(self.board.occupied) <= 7
-
-        if out_of_book or too_deep or too_many_moves or not has_time or is_endgame:
-            return
-
-        timeout = self.config['online_moves']['chessdb']['timeout']
-        min_eval_depth = self.config['online_moves']['chessdb']['min_eval_depth']
-
-        if response := self.api.get_chessdb_eval(self.board.fen(), timeout):
-            if response['status'] == 'ok':
-                if response['depth'] >= min_eval_depth:
-                    self.out_of_chessdb_counter = 0
-                    pv = [chess.Move.from_uci(uci_move) for uci_move in response['pv']]
-                    if not self._is_repetition(pv[0]):
-                        self.chessdb_counter += 1
-                        pov_score = chess.engine.PovScore(chess.engine.Cp(response['score']), self.board.turn)
-                        message = f'ChessDB: {self._format_move(pv[0]):14} {self._format_score(pov_score)}' \
-                                  f'Depth: {response["depth"]}'
-                        return Move_Response(pv[0], message, pv=pv)
-
-            self.out_of_chessdb_counter += 1
-        else:
-            self._reduce_own_time(timeout)
-
-    def _make_gaviota_move(self) -> Move_Response | None:
-        assert self.gaviota_tablebase
-
-        if chess.popcount(self.board.occupied) > self.config['gaviota']['max_pieces']:
-            return
+        for move_source in self.move_sources:
+            replies.extend(move_source.get_expected_replies(self.board))
 
-        best_moves: list[chess.Move] = []
-        best_wdl = -2
-        best_dtm = 1_000_000
-        for move in self.board.legal_moves:
-            board_copy = self.board.copy(stack=False)
-            board_copy.push(move)
+        unique_replies = [reply for reply in dict.fromkeys(replies) if reply in self.board.legal_moves]
+        return unique_replies[:self.prefetch_max_replies]
 
-            if board_copy.is_checkmate():
-                wdl = 2
-                dtm = 0
-            else:
-                try:
-                    dtm = -self.gaviota_tablebase.probe_dtm(board_copy)
-                    wdl = self._value_to_wdl(dtm, board_copy.halfmove_clock)
-                except chess.gaviota.MissingTableError:
-                    return
-
-            if best_moves:
-                if wdl > best_wdl:
-                    best_moves = [move]
-                    best_wdl = wdl
-                    best_dtm = dtm
-                elif wdl == best_wdl:
-                    if dtm < best_dtm:
-                        best_moves = [move]
-                        best_dtm = dtm
-                    elif dtm == best_dtm:
-                        best_moves.append(move)
-            else:
-                best_moves.append(move)
-                best_wdl = wdl
-                best_dtm = dtm
-
-        if best_wdl == 2:
-            egtb_info = self._format_egtb_info('win', dtm=best_dtm)
-            offer_draw = False
-            resign = False
-        elif best_wdl == 0:
-            egtb_info = self._format_egtb_info('draw', dtm=0)
-            offer_draw = True
-            resign = False
-        elif best_wdl == -2:
-            egtb_info = self._format_egtb_info('loss', dtm=best_dtm)
-            offer_draw = False
-            resign = True
-        else:
-            return
-
-        self.engine.stop_pondering()
-        move = random.choice(best_moves)
-        message = f'Gaviota: {self._format_move(move):14} {egtb_info}'
-        return Move_Response(move, message, is_drawish=offer_draw, is_resignable=resign)
+    def _request_online_responses(self) -> None:
+        for online_source in self._get_online_sources():
+            if online_request := online_source.get_online_request(self.board):
+                future = self.api.executor.submit(self._fetch_online_response, online_request, self.board.copy())
+                self.pending_online_responses[online_request.source] = future, time.monotonic() + online_request.timeout
 
-    def _make_syzygy_move(self) -> Move_Response | None:
-        assert self.syzygy_tablebase
+    def _cancel_online_requests(self) -> None:
+        # Requests that are already running finish in the background and still fill the cache.
+        for future, _ in self.pending_online_responses.values():
+            future.cancel()
 
-        if chess.popcount(self.board.occupied) > self.config['syzygy']['max_pieces'] or self._has_mate_score():
-            return
+        self.pending_online_responses.clear()
 
-        best_moves: list[chess.Move] = []
-        best_wdl = -2
-        best_dtz = 1_000_000
-        best_real_dtz = best_dtz
-        for move in self.board.legal_moves:
-            board_copy = self.board.copy(stack=False)
-            board_copy.push(move)
+    def get_online_response(self, online_request: Online_Request, deadline: float) -> dict | None:
+        wait_start = time.monotonic()
 
+        if pending_response := self.pending_online_responses.pop(online_request.source, None):
+            future, request_deadline = pending_response
             try:
-                dtz = -self.syzygy_tablebase.probe_dtz(board_copy)
-            except chess.syzygy.MissingTableError:
-                return
-
-            wdl = self._value_to_wdl(dtz, board_copy.halfmove_clock)
-
-            real_dtz = dtz
-            if board_copy.halfmove_clock == 0:
-                if wdl < 0:
-                    dtz += 10_000
-                elif wdl > 0:
-                    dtz -= 10_000
-
-            if best_moves:
-                if wdl > best_wdl:
-                    best_moves = [move]
-                    best_wdl = wdl
-                    best_dtz = dtz
-                    best_real_dtz = real_dtz
-                elif wdl == best_wdl:
-                    if dtz < best_dtz:
-                        best_moves = [move]
-                        best_dtz = dtz
-                        best_real_dtz = real_dtz
-                    elif dtz == best_dtz:
-                        best_moves.append(move)
-            else:
-                best_moves.append(move)
-                best_wdl = wdl
-                best_dtz = dtz
-                best_real_dtz = real_dtz
-
-        if best_wdl == 2:
-            egtb_info = self._format_egtb_info('win', dtz=best_real_dtz)
-            offer_draw = False
-            resign = False
-        elif best_wdl == 1:
-            egtb_info = self._format_egtb_info('cursed win', dtz=best_real_dtz)
-            offer_draw = False
-            resign = False
-        elif best_wdl == 0:
-            egtb_info = self._format_egtb_info('draw', dtz=0)
-            offer_draw = True
-            resign = False
-        elif best_wdl == -1:
-            egtb_info = self._format_egtb_info('blessed loss', dtz=best_real_dtz)
-            offer_draw = True
-            resign = False
+                # A response that is already there is used even after the deadline of the turn.
+                response = future.result(timeout=max(min(request_deadline, deadline) - wait_start, 0.0))
+            except FutureTimeoutError:
+                future.cancel()
+                response = None
         else:
-            egtb_info = self._format_egtb_info('loss', dtz=best_real_dtz)
-            offer_draw = False
-            resign = True
-
-        self.engine.stop_pondering()
-        move = random.choice(best_moves)
-        message = f'Syzygy:  {self._format_move(move):14} {egtb_info}'
-        return Move_Response(move, message, is_drawish=offer_draw, is_resignable=resign)
-
-    def _value_to_wdl(self, value: int, halfmove_clock: int) -> int:
-        if value > 0:
-            if value + halfmove_clock <= 100:
-                return 2
-
-            return 1
+            response = self._fetch_online_response(online_request, self.board)
 
-        if value < 0:
-            if value - halfmove_clock >= -100:
-                return -2
+        if not response:
+            self._reduce_own_time(time.monotonic() - wait_start)
 
-            return -1
+        return response
 
-        return 0
+    def _fetch_online_response(self, online_request: Online_Request, board: chess.Board) -> dict | None:
+        if response := self.api.online_cache.get(online_request.source, board, online_request.params):
+            return response
 
-    def _get_syzygy_tablebase(self) -> chess.syzygy.Tablebase | None:
-        enabled = self.config['syzygy']['enabled'] and self.config['syzygy']['instant_play']
-
-        if not enabled:
+        budget = self.api.circuit_breaker.get_budget(online_request.timeout, self.own_time)
+        if not self.api.circuit_breaker.allow(online_request.source, budget):
             return
 
-        paths = self.config['syzygy']['paths']
-        tablebase = chess.syzygy.open_tablebase(paths[0], VariantBoard=type(self.board))
-
-        for path in paths[1:]:
-            tablebase.add_directory(path)
+        response = None
+        request_start = time.monotonic()
+        try:
+            response = online_request.request()
+        finally:
+            self.api.circuit_breaker.record(online_request.source, time.monotonic() - request_start,
+                                            response is not None)
 
-        return tablebase
+        if response:
+            self.api.online_cache.put(online_request.source, board, response, online_request.params)
 
-    def _get_gaviota_tablebase(self) -> chess.gaviota.PythonTablebase | chess.gaviota.NativeTablebase | None:
-        enabled = self.config['gaviota']['enabled']
+        return response
 
-        if not enabled:
-            return
-
-        paths = self.config['gaviota']['paths']
-        tablebase = chess.gaviota.open_tablebase(paths[0])
-
-        for path in paths[1:]:
-            tablebase.add_directory(path)
-
-        return tablebase
-
-    def _make_egtb_move(self) -> Move_Response | None:
-        max_pieces = 7 if self.board.uci_variant == 'chess' else 6
-        is_endgame = chess.popcount(self.board.occupied) <= max_pieces
-        has_time = self._has_time(self.config['online_moves']['online_egtb']['min_time'])
-
-        if not is_endgame or not has_time or self._has_mate_score():
-            return
-
-        timeout = self.config['online_moves']['online_egtb']['timeout']
-        variant = 'standard' if self.board.uci_variant == 'chess' else self.board.uci_variant
-        assert variant
-
-        if response := self.api.get_egtb(self.board.fen(), variant, timeout):
-            uci_move: str = response['moves'][0]['uci']
-            outcome: str = response['category']
-            dtz: int = -response['moves'][0]['dtz']
-            dtm: int | None = response['dtm']
-            offer_draw = outcome in ['draw', 'blessed loss']
-            resign = outcome == 'loss'
-            move = chess.Move.from_uci(uci_move)
-            message = f'EGTB:    {self._format_move(move):14} {self._format_egtb_info(outcome, dtz, dtm)}'
-            return Move_Response(move, message, is_drawish=offer_draw, is_resignable=resign)
-
-        self._reduce_own_time(timeout)
-
-    def _format_move(self, move: chess.Move) -> str:
+    def format_move(self, move: chess.Move) -> str:
         if self.board.turn:
             move_number = f'{self.board.fullmove_number} ...'
             return f'{move_number:4} {self.board.san(move)}'
@@ -608,7 +416,7 @@ class Lichess_Game:
 
     def _format_engine_info(self, info: chess.engine.InfoDict) -> str:
         info_score = info.get('score')
-        score = f'{self._format_score(info_score):7}' if info_score else 7 * ' '
+        score = f'{self.format_score(info_score):7}' if info_score else 7 * ' '
 
         info_depth = info.get('depth')
         info_seldepth = info.get('seldepth')
@@ -623,9 +431,9 @@ class Lichess_Game:
 
         if info_time := info.get('time'):
             minutes, seconds = divmod(info_time, 60)
-            time = f'MT: {minutes:02.0f}:{seconds:004.1f}'
+            move_time = f'MT: {minutes:02.0f}:{seconds:004.1f}'
         else:
-            time = 11 * ' '
+            move_time = 11 * ' '
 
         info_hashfull = info.get('hashfull')
         hashfull = f'Hash: {info_hashfull/10:5.1f} %' if info_hashfull else 13 * ' '
@@ -634,7 +442,7 @@ class Lichess_Game:
         tbhits = f'TB: {self._format_number(info_tbhits)}' if info_tbhits else ''
         delimiter = 5 * ' '
 
-        return delimiter.join((score, depth, nodes, nps, time, hashfull, tbhits))
+        return delimiter.join((score, depth, nodes, nps, move_time, hashfull, tbhits))
 
     def _format_number(self, number: int) -> str:
         if number >= 1_000_000_000_000:
@@ -651,7 +459,7 @@ class Lichess_Game:
 
         return f'{number:5}  '
 
-    def _format_score(self, score: chess.engine.PovScore) -> str:
+    def format_score(self, score: chess.engine.PovScore) -> str:
         if not score.is_mate():
             if cp_score := score.pov(self.board.turn).score():
                 cp_score /= 100
@@ -661,7 +469,7 @@ class Lichess_Game:
 
         return str(score.pov(self.board.turn))
 
-    def _format_egtb_info(self, outcome: Outcome, dtz: DTZ | None = None, dtm: DTM | None = None) -> str:
+    def format_egtb_info(self, outcome: Outcome, dtz: DTZ | None = None, dtm: DTM | None = None) -> str:
         outcome_str = f'{outcome:>7}'
         dtz_str = f'DTZ: {dtz}' if dtz else ''
         dtm_str = f'DTM: {dtm}' if dtm else ''
@@ -669,64 +477,6 @@ class Lichess_Game:
 
         return delimiter.join(filter(None, [outcome_str, dtz_str, dtm_str]))
 
-    def _format_book_info(self, weight: float, learn: int) -> str:
-        output = [f'{weight:>5.0f} %']
-        if learn:
-            performance, wdl = self._deserialize_learn(learn)
-            output.append(f'Performance: {performance}')
-            output.append(f'WDL: {wdl[0]:5.1f} % {wdl[1]:5.1f} % {wdl[2]:5.1f} %')
-        delimiter = 5 * ' '
-
-        return delimiter.join(output)
-
-    def _deserialize_learn(self, learn: int) -> tuple[Performance, tuple[float, float, float]]:
-        performance = (learn >> 20) & 0b111111111111
-        win = ((learn >> 10) & 0b1111111111) / 1020.0 * 100.0
-        draw = (learn & 0b1111111111) / 1020.0 * 100.0
-        loss = max(100.0 - win - draw, 0.0)
-
-        return performance, (win, draw, loss)
-
-    def _get_engine_key(self) -> str:
-        color = 'white' if self.is_white else 'black'
-
-        if self.board.uci_variant == 'chess':
-            if self.board.chess960:
-                if f'chess960_{color}' in self.config['engines']:
-                    return f'chess960_{color}'
-
-                if 'chess960' in self.config['engines']:
-                    return 'chess960'
-
-            else:
-                if f'{self.game_info.speed}_{color}' in self.config['engines']:
-                    return f'{self.game_info.speed}_{color}'
-
-                if self.game_info.speed in self.config['engines']:
-                    return self.game_info.speed
-
-        else:
-            for alias in [alias.lower() for alias in self.board.aliases]:
-                if f'{alias}_{color}' in self.config['engines']:
-                    return f'{alias}_{color}'
-
-                if alias in self.config['engines']:
-                    return alias
-
-            if f'variants_{color}' in self.config['engines']:
-                return f'variants_{color}'
-
-            if 'variants' in self.config['engines']:
-                return 'variants'
-
-        if f'standard_{color}' in self.config['engines']:
-            return f'standard_{color}'
-
-        if 'standard' in self.config['engines']:
-            return 'standard'
-
-        raise RuntimeError(f'No suitable engine for "{self.board.uci_variant}" configured.')
-
     def _setup_board(self) -> chess.Board:
         if self.game_info.variant == Variant.CHESS960:
             board = chess.Board(self.game_info.initial_fen, chess960=True)
@@ -741,59 +491,72 @@ class Lichess_Game:
 
         return board
 
-    def _get_move_sources(self) -> list[Callable[[], Move_Response | None]]:
-        opening_sources: dict[Callable[[], Move_Response | None], int] = {}
-
-        if self.config['opening_books']['enabled']:
-            priority = self.config['opening_books'].get('priority', 400)
-            opening_sources[self._make_book_move] = priority
-
-        if self.config['online_moves']['opening_explorer']['enabled']:
-            use_for_variants = self.config['online_moves']['opening_explorer'].get('use_for_variants', False)
-            if self.board.uci_variant == 'chess' or use_for_variants:
-                priority = self.config['online_moves']['opening_explorer'].get('priority', 300)
-                opening_sources[self._make_opening_explorer_move] = priority
+    def _get_move_sources(self) -> list[Move_Source]:
+        move_sources = [move_source for source_type in MOVE_SOURCES if (move_source := source_type.from_config(self))]
+        # The tablebases are always asked last, the priorities only order the sources within their tier.
+        return sorted(move_sources, key=lambda move_source: (not move_source.is_tablebase, move_source.priority),
+                      reverse=True)
+
+    def _get_online_sources(self) -> list[Online_Move_Source]:
+        return [move_source for move_source in self.move_sources if isinstance(move_source, Online_Move_Source)]
+
+    def _get_hedged_sources(self) -> list[Online_Move_Source]:
+        hedged_search_config: dict = self.config.get('hedged_search', {})
+        if not hedged_search_config.get('enabled', False):
+            return []
+
+        # Sources that usually answer after the window can not preempt the search.
+        return [online_source for online_source in self._get_online_sources()
+                if online_source.is_hedgeable
+                and online_source.get_cost() < hedged_search_config.get('window', 1.0)]
+
+    def _get_limit(self) -> chess.engine.Limit:
+        return self.time_manager.get_limit(self.board,
+                                           own_time=self.own_time,
+                                           opponent_time=self.opponent_time,
+                                           increment=self.increment,
+                                           move_overhead=self._get_current_move_overhead(),
+                                           scores=self.scores,
+                                           after_book=not self.last_move_by_engine)
 
-        if self.config['online_moves']['lichess_cloud']['enabled']:
-            only_without_book = self.config['online_moves']['lichess_cloud'].get('only_without_book', False)
-            if not (only_without_book and self.book_settings.readers):
-                priority = self.config['online_moves']['lichess_cloud'].get('priority', 200)
-                opening_sources[self._make_cloud_move] = priority
-
-        if self.config['online_moves']['chessdb']['enabled']:
-            if self.board.uci_variant == 'chess':
-                priority = self.config['online_moves']['chessdb'].get('priority', 100)
-                opening_sources[self._make_chessdb_move] = priority
+    def _get_move_overhead(self) -> float:
+        multiplier = self.config.get('move_overhead_multiplier', 1.0)
+        return max(self.game_info.initial_time_ms / 60_000 * multiplier, 1.0)
 
-        move_sources = [opening_source
-                        for opening_source, _
-                        in sorted(opening_sources.items(), key=lambda item: item[1], reverse=True)]
+    def _get_current_move_overhead(self) -> float:
+        return self.api.lag_model.get_move_overhead(self._get_move_overhead())
 
-        if self.config['syzygy']['enabled'] and self.config['syzygy']['instant_play']:
-            if self.board.uci_variant in ['chess', 'antichess', 'atomic']:
-                move_sources.append(self._make_syzygy_move)
+    def _record_lag(self, gameState_event: dict) -> None:
+        # The clocks only start running after the first move of each side.
+        is_measurable = len(self.board.move_stack) >= 3 and self.game_info.speed != 'correspondence'
+        own_clock = (gameState_event['wtime'] if self.is_white else gameState_event['btime']) / 1000
+        self.move_timer.record(own_clock, self.increment, is_measurable)
 
-        if self.config['gaviota']['enabled']:
-            if self.board.uci_variant == 'chess':
-                move_sources.append(self._make_gaviota_move)
+    def get_online_timeout(self, board: chess.Board, source_config: dict) -> float | None:
+        if len(self.board.move_stack) < 2:
+            # The clocks only start running after the first move of each side.
+            return source_config['timeout']
 
-        if self.config['online_moves']['online_egtb']['enabled']:
-            if self.board.uci_variant in ['chess', 'antichess', 'atomic']:
-                move_sources.append(self._make_egtb_move)
+        return self.time_manager.get_online_timeout(board, self.own_time, self.increment,
+                                                    self._get_current_move_overhead(), source_config)
 
-        return move_sources
+    def _get_source_deadline(self) -> float:
+        if len(self.board.move_stack) < 2:
+            # The clocks only start running after the first move of each side.
+            return float('inf')
 
-    def _get_move_overhead(self) -> float:
-        multiplier = self.config.get('move_overhead_multiplier', 1.0)
-        return max(self.game_info.initial_time_ms / 60_000 * multiplier, 1.0)
+        return time.monotonic() + self.time_manager.get_source_budget(self.board, self.own_time, self.increment,
+                                                                      self._get_current_move_overhead())
 
-    def _has_time(self, min_time: float) -> bool:
+    def _get_engine_move_time(self) -> float:
         if len(self.board.move_stack) < 2:
-            return True
+            # The clocks only start running after the first move of each side.
+            return 0.0
 
-        return self.own_time >= min_time
+        return self.time_manager.get_move_time(self.board, self.own_time, self.increment,
+                                               self._get_current_move_overhead())
 
-    def _has_mate_score(self) -> bool:
+    def has_mate_score(self) -> bool:
         for score in filter(None, reversed(self.scores)):
             mate = score.relative.mate()
             return mate is not None and mate > 0
@@ -806,7 +569,5 @@ class Lichess_Game:
         else:
             self.black_time -= seconds
 
-    def _is_repetition(self, move: chess.Move) -> bool:
-        board = self.board.copy()
-        board.push(move)
-        return board.is_repetition(count=2)
+    def is_repetition_after(self, move: chess.Move) -> bool:
+        return self.repetition_tracker.is_repetition_after(self.board, move)
@@ -0,0 +1,143 @@
+import sqlite3
+import time
+from threading import Lock
+from typing import Any
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from lichess_bot_dataclasses import Game_Information
+
+SPEEDS = ['bullet', 'blitz', 'rapid', 'classical']
+
+
+class Local_Explorer:
+    '''Opening explorer of the bot's own games, stored in SQLite.
+
+    Every position in which the bot was to move keeps the results of the moves played there, split by variant,
+    color and speed, and the sum of the opponent ratings for the performance. Lookups return the response
+    shape of the Lichess player explorer.'''
+
+    def __init__(self, config: dict) -> None:
+        explorer_config: dict = config.get('local_explorer', {})
+        self.enabled: bool = explorer_config.get('enabled', False)
+        self.max_plies: int = explorer_config.get('max_plies', 40)
+        self.lock = Lock()
+
+        if self.enabled:
+            self.connection = sqlite3.connect(explorer_config.get('path', 'local_explorer.sqlite3'),
+                                              check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS moves ('
+                                    'variant TEXT, color TEXT, speed TEXT, position INTEGER, extra TEXT, uci TEXT, '
+                                    'white INTEGER, draws INTEGER, black INTEGER, rating_sum INTEGER, '
+                                    'PRIMARY KEY (variant, color, speed, position, extra, uci)) WITHOUT ROWID')
+
+    def get(self, board: chess.Board, color: str) -> dict[str, Any]:
+        with self.lock:
+            rows = self.connection.execute('SELECT uci, SUM(white), SUM(draws), SUM(black), SUM(rating_sum) '
+                                           'FROM moves WHERE variant = ? AND color = ? AND position = ? AND extra = ? '
+                                           f'AND speed IN ({", ".join("?" * len(SPEEDS))}) GROUP BY uci',
+                                           (board.uci_variant, color, *self._get_position(board), *SPEEDS)).fetchall()
+
+        moves: list[dict[str, Any]] = []
+        for uci, white, draws, black, rating_sum in rows:
+            game_count = white + draws + black
+            wins, losses = (white, black) if color == 'white' else (black, white)
+            moves.append({'uci': uci, 'white': white, 'draws': draws, 'black': black,
+                          'averageOpponentRating': round(rating_sum / game_count),
+                          'performance': round((rating_sum + 400 * (wins - losses)) / game_count)})
+
+        moves.sort(key=lambda move: move['white'] + move['draws'] + move['black'], reverse=True)
+        return {'white': sum(move['white'] for move in moves),
+                'draws': sum(move['draws'] for move in moves),
+                'black': sum(move['black'] for move in moves),
+                'moves': moves}
+
+    def add_game(self, board: chess.Board, is_white: bool, game_info: Game_Information, game_state: dict) -> None:
+        if not self.enabled or not game_info.rated or game_state['status'] in ['aborted', 'noStart']:
+            return
+
+        opponent_rating = game_info.black_rating if is_white else game_info.white_rating
+        if opponent_rating:
+            with self.lock:
+                self._add_game(board, 'white' if is_white else 'black', game_info.speed, game_state.get('winner'),
+                               opponent_rating)
+
+    def import_pgn(self, pgn_path: str, username: str) -> None:
+        print(f'Importing the games of {username} from "{pgn_path}" ...')
+        import_start = time.perf_counter()
+        game_count = 0
+
+        # The connection commits the whole import at the end and rolls it back if any game fails.
+        with self.lock, self.connection, open(pgn_path, encoding='utf-8') as pgn_file:
+            self.connection.execute('BEGIN')
+            while game := chess.pgn.read_game(pgn_file):
+                if game.errors or not game.headers.get('Event', '').startswith('Rated'):
+                    continue
+
+                if game.headers.get('White', '').lower() == username.lower():
+                    color, rating_header = 'white', 'BlackElo'
+                elif game.headers.get('Black', '').lower() == username.lower():
+                    color, rating_header = 'black', 'WhiteElo'
+                else:
+                    continue
+
+                if not game.headers.get(rating_header, '').isdigit():
+                    continue
+
+                winner = {'1-0': 'white', '0-1': 'black', '1/2-1/2': None}.get(game.headers.get('Result', '*'), '')
+                if winner == '':
+                    continue
+
+                speed = self._get_speed(game.headers.get('TimeControl', '-'))
+                self._add_game(game.end().board(), color, speed, winner, int(game.headers[rating_header]))
+                game_count += 1
+
+        print(f'Imported {game_count} games in {time.perf_counter() - import_start:.1f} s.')
+
+    def _add_game(self, board: chess.Board, color: str, speed: str, winner: str | None, opponent_rating: int) -> None:
+        white, draws, black = int(winner == 'white'), int(winner is None), int(winner == 'black')
+        replay_board = board.root()
+        rows: list[tuple] = []
+        for move in board.move_stack[:self.max_plies]:
+            if replay_board.turn == (color == 'white'):
+                rows.append((replay_board.uci_variant, color, speed, *self._get_position(replay_board), move.uci(),
+                             white, draws, black, opponent_rating))
+            replay_board.push(move)
+
+        self.connection.executemany('INSERT INTO moves VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                                    'ON CONFLICT (variant, color, speed, position, extra, uci) DO UPDATE SET '
+                                    'white = white + excluded.white, draws = draws + excluded.draws, '
+                                    'black = black + excluded.black, rating_sum = rating_sum + excluded.rating_sum',
+                                    rows)
+
+    def _get_position(self, board: chess.Board) -> tuple[int, str]:
+        # SQLite integers are signed 64 bit.
+        position = chess.polyglot.zobrist_hash(board) - 2 ** 63
+        if board.uci_variant in ['crazyhouse', '3check']:
+            # Pockets and remaining checks are not part of the Zobrist hash.
+            return position, board.epd()
+
+        return position, ''
+
+    def _get_speed(self, time_control: str) -> str:
+        if '+' not in time_control:
+            return 'correspondence'
+
+        initial_time, increment = time_control.split('+')
+        estimated_time = int(initial_time) + 40 * int(increment)
+        if estimated_time < 30:
+            return 'ultraBullet'
+
+        if estimated_time < 180:
+            return 'bullet'
+
+        if estimated_time < 480:
+            return 'blitz'
+
+        if estimated_time < 1500:
+            return 'rapid'
+
+        return 'classical'
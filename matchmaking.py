@@ -25,6 +25,7 @@ class Matchmaking:
         self.game_start_time: datetime = datetime.now()
         self.online_bots: list[Bot] = []
         self.current_type: Matchmaking_Type | None = None
+        self.last_challenge_request: Challenge_Request | None = None
 
     def create_challenge(self, pending_challenge: Pending_Challenge) -> None:
         if self._call_update():
@@ -74,6 +75,7 @@ class Matchmaking:
         challenge_request = Challenge_Request(opponent.username, self.current_type.initial_time,
                                               self.current_type.increment, self.current_type.rated, color,
                                               self.current_type.variant, self.timeout)
+        self.last_challenge_request = challenge_request
 
         last_response: Challenge_Response | None = None
         for response in self.challenger.create(challenge_request):
@@ -0,0 +1,640 @@
+import importlib
+import random
+import time
+from abc import ABC, abstractmethod
+from itertools import groupby
+from typing import TYPE_CHECKING, TypeVar
+
+import chess
+import chess.engine
+import chess.gaviota
+import chess.syzygy
+
+from aliases import Performance
+from lichess_bot_dataclasses import Book_Settings, Move_Response, Online_Request
+from syzygy_prober import Syzygy_Prober, value_to_wdl
+
+if TYPE_CHECKING:
+    from lichess_game import Lichess_Game
+
+Source_Type = TypeVar('Source_Type', bound=type['Move_Source'])
+MOVE_SOURCES: list[type['Move_Source']] = []
+
+
+def register_move_source(source_type: Source_Type) -> Source_Type:
+    MOVE_SOURCES.append(source_type)
+    return source_type
+
+
+def load_move_source_plugins(config: dict) -> None:
+    # Plugin modules register their sources with register_move_source when they are imported.
+    for module_name in config.get('move_source_plugins', []):
+        importlib.import_module(module_name)
+
+
+class Move_Source(ABC):
+    '''A source of moves that a game asks before the engine searches.
+
+    Sources declare the variants, piece counts and plies they apply to. The game asks the applicable sources in
+    order of priority and plays the first move proposed, tablebases are asked after all other sources. Sources
+    that keep missing are skipped for the rest of the game, so are sources that already played max_moves moves.'''
+
+    name = ''
+    default_priority = 0
+    variants: tuple[str, ...] = ()
+    max_misses: int | None = None
+    avoids_repetition = True
+    is_tablebase = False
+
+    def __init__(self, game: 'Lichess_Game', source_config: dict) -> None:
+        self.game = game
+        self.source_config = source_config
+        self.priority: int = source_config.get('priority', self.default_priority)
+        self.max_depth: float = source_config.get('max_depth', float('inf'))
+        self.max_moves: float = source_config.get('max_moves', float('inf'))
+        self.min_pieces = 0
+        self.max_pieces = 64
+        self.move_count = 0
+        self.miss_count = 0
+
+    @classmethod
+    def get_config(cls, config: dict) -> dict:
+        return config['online_moves'][cls.name]
+
+    @classmethod
+    def from_config(cls, game: 'Lichess_Game') -> 'Move_Source | None':
+        source_config = cls.get_config(game.config)
+        if not source_config['enabled']:
+            return
+
+        if cls.variants and game.board.uci_variant not in cls.variants:
+            return
+
+        return cls(game, source_config)
+
+    def is_applicable(self, board: chess.Board) -> bool:
+        if self.max_misses is not None and self.miss_count >= self.max_misses:
+            return False
+
+        if board.ply() >= self.max_depth or self.move_count >= self.max_moves:
+            return False
+
+        return self.min_pieces <= chess.popcount(board.occupied) <= self.max_pieces
+
+    def get_cost(self) -> float:
+        '''Returns the expected seconds until the source proposes a move.'''
+
+        return 0.0
+
+    @abstractmethod
+    def propose(self, board: chess.Board, deadline: float) -> Move_Response | None:
+        '''Returns the move of this source in the position of the game or None.
+
+        The game only asks applicable sources and gives all of them the deadline of the turn in time.monotonic()
+        seconds, a source that has no move by then returns None. Implementations pass their result through
+        _record.'''
+
+    def get_expected_replies(self, board: chess.Board) -> list[chess.Move]:  # pylint: disable=unused-argument
+        '''Returns the replies of the opponent this source knows, best first.'''
+
+        return []
+
+    def close(self) -> None:
+        pass
+
+    def _record(self, move_response: Move_Response | None) -> Move_Response | None:
+        if move_response and not (self.avoids_repetition and self.game.is_repetition_after(move_response.move)):
+            self.miss_count = 0
+            self.move_count += 1
+            return move_response
+
+        self.miss_count += 1
+
+
+class Online_Move_Source(Move_Source):
+    '''A move source that asks an online service.
+
+    The request is built from the position and the time budget of the game, the game sends the requests of all
+    online sources at once and caches, rate limits and prefetches them. A request without a response is not
+    counted as a miss.'''
+
+    max_misses = 5
+    is_hedgeable = False
+    is_prefetched = True
+
+    def get_online_request(self, board: chess.Board) -> Online_Request | None:
+        if not self.is_applicable(board):
+            return
+
+        return self._get_timed_request(board)
+
+    def get_cost(self) -> float:
+        return self.game.api.circuit_breaker.get_latency(self.name) or 0.0
+
+    def propose(self, board: chess.Board, deadline: float) -> Move_Response | None:
+        if not (online_request := self._get_timed_request(board)):
+            return
+
+        if not (response := self.game.get_online_response(online_request, deadline)):
+            return
+
+        return self._record(self._get_online_move(board, response))
+
+    def _get_timed_request(self, board: chess.Board) -> Online_Request | None:
+        if (timeout := self.game.get_online_timeout(board, self.source_config)) is None:
+            return
+
+        return self._get_request(board, timeout)
+
+    @abstractmethod
+    def _get_request(self, board: chess.Board, timeout: float) -> Online_Request | None:
+        '''Returns the request of this source in the position of the board.'''
+
+    @abstractmethod
+    def _get_online_move(self, board: chess.Board, response: dict) -> Move_Response | None:
+        '''Returns the move of this source in the response or None.'''
+
+
+@register_move_source
+class Book_Source(Move_Source):
+    name = 'opening_books'
+    default_priority = 400
+    max_misses = 10
+
+    def __init__(self, game: 'Lichess_Game', source_config: dict, book_key: str) -> None:
+        super().__init__(game, source_config)
+        book_config: dict = source_config['books'][book_key]
+        self.book_settings = Book_Settings(book_config['selection'], book_config.get('max_depth', 600),
+                                           game.handle_registry.acquire_book_index(source_config, book_key))
+        self.max_depth = self.book_settings.max_depth
+
+    @classmethod
+    def get_config(cls, config: dict) -> dict:
+        return config['opening_books']
+
+    @classmethod
+    def from_config(cls, game: 'Lichess_Game') -> 'Move_Source | None':
+        source_config = cls.get_config(game.config)
+        if not source_config['enabled'] or not (book_key := cls.get_book_key(game)):
+            return
+
+        return cls(game, source_config, book_key)
+
+    @staticmethod
+    def get_book_key(game: 'Lichess_Game') -> str | None:
+        books: dict[str, dict] = game.config['opening_books']['books']
+        color = 'white' if game.is_white else 'black'
+
+        if game.board.uci_variant != 'chess':
+            for alias in [alias.lower() for alias in game.board.aliases]:
+                if f'{alias}_{color}' in books:
+                    return f'{alias}_{color}'
+
+                if alias in books:
+                    return alias
+
+            return
+
+        if game.board.chess960:
+            if f'chess960_{color}' in books:
+                return f'chess960_{color}'
+
+            if 'chess960' in books:
+                return 'chess960'
+
+        else:
+            if f'{game.game_info.speed}_{color}' in books:
+                return f'{game.game_info.speed}_{color}'
+
+            if game.game_info.speed in books:
+                return game.game_info.speed
+
+        if f'standard_{color}' in books:
+            return f'standard_{color}'
+
+        if 'standard' in books:
+            return 'standard'
+
+        return
+
+    def get_expected_replies(self, board: chess.Board) -> list[chess.Move]:
+        book_entries = self.book_settings.index.find_all(board) if self.book_settings.index else []
+        return [entry.move for entry in sorted(book_entries, key=lambda entry: entry.weight, reverse=True)]
+
+    def close(self) -> None:
+        if self.book_settings.index:
+            self.game.handle_registry.release(self.book_settings.index)
+
+    def propose(self, board: chess.Board, deadline: float) -> Move_Response | None:  # pylint: disable=unused-argument
+        return self._record(self._get_book_move(board))
+
+    def _get_book_move(self, board: chess.Board) -> Move_Response | None:
+        read_learn = self.source_config.get('read_learn')
+        book_entries = self.book_settings.index.find_all(board) if self.book_settings.index else []
+        # The entries are grouped by book in the configured order, the weights are in percent of their book.
+        for name, entries in groupby(book_entries, key=lambda entry: entry.book):
+            entries = list(entries)
+            if self.book_settings.selection == 'weighted_random':
+                entry, = random.choices(entries, [entry.weight for entry in entries])
+            elif self.book_settings.selection == 'uniform_random':
+                entry = random.choice(entries)
+            else:
+                entry = max(entries, key=lambda entry: entry.weight)
+
+            if not self.game.is_repetition_after(entry.move):
+                learn = entry.learn if read_learn else 0
+                name = name if self.book_settings.index and len(self.book_settings.index.names) > 1 else ''
+                public_message = f'Book:    {self.game.format_move(entry.move):14}'
+                private_message = f'{self._format_book_info(entry.weight, learn)}     {name}'
+                return Move_Response(entry.move, public_message, private_message=private_message)
+
+    def _format_book_info(self, weight: float, learn: int) -> str:
+        output = [f'{weight:>5.0f} %']
+        if learn:
+            performance, wdl = self._deserialize_learn(learn)
+            output.append(f'Performance: {performance}')
+            output.append(f'WDL: {wdl[0]:5.1f} % {wdl[1]:5.1f} % {wdl[2]:5.1f} %')
+        delimiter = 5 * ' '
+
+        return delimiter.join(output)
+
+    def _deserialize_learn(self, learn: int) -> tuple[Performance, tuple[float, float, float]]:
+        performance = (learn >> 20) & 0b111111111111
+        win = ((learn >> 10) & 0b1111111111) / 1020.0 * 100.0
+        draw = (learn & 0b1111111111) / 1020.0 * 100.0
+        loss = max(100.0 - win - draw, 0.0)
+
+        return performance, (win, draw, loss)
+
+
+@register_move_source
+class Opening_Explorer_Source(Online_Move_Source):
+    name = 'opening_explorer'
+    default_priority = 300
+
+    @classmethod
+    def from_config(cls, game: 'Lichess_Game') -> 'Move_Source | None':
+        source_config = cls.get_config(game.config)
+        if not source_config['enabled']:
+            return
+
+        if game.board.uci_variant != 'chess' and not source_config.get('use_for_variants', False):
+            return
+
+        return cls(game, source_config)
+
+    def get_expected_replies(self, board: chess.Board) -> list[chess.Move]:
+        # The opponent's own games from the explorer, as far as they are already cached.
+        if not (online_request := self.get_online_request(board)):
+            return []
+
+        if not (response := self.game.api.online_cache.get(online_request.source, board, online_request.params)):
+            return []
+
+        moves = sorted(response['moves'], key=lambda move: move['white'] + move['draws'] + move['black'],
+                       reverse=True)
+        return [chess.Move.from_uci(move['uci']) for move in moves]
+
+    def _get_request(self, board: chess.Board, timeout: float) -> Online_Request | None:
+        anti = self.source_config['anti']
+
+        if anti:
+            color = 'black' if board.turn else 'white'
+            username = self.game.game_info.black_name if board.turn else self.game.game_info.white_name
+        else:
+            color = 'white' if board.turn else 'black'
+            username = self.game.game_info.white_name if board.turn else self.game.game_info.black_name
+
+        api = self.game.api
+        if not anti and api.local_explorer.enabled and username == self.game.config['username']:
+            # Our own games are served from the local explorer.
+            local_board = board.copy(stack=False)
+            return Online_Request('local_explorer', lambda: api.local_explorer.get(local_board, color), timeout)
+
+        fen = board.fen()
+        variant = self.game.game_info.variant
+        return Online_Request('opening_explorer',
+                              lambda: api.get_opening_explorer(username, fen, variant, color, timeout),
+                              timeout, f'{username} {color}')
+
+    def _get_online_move(self, board: chess.Board, response: dict) -> Move_Response | None:
+        min_games = max(self.source_config['min_games'], 1)
+        only_with_wins = self.source_config['only_with_wins']
+
+        game_count = response['white'] + response['draws'] + response['black']
+        if game_count < min_games:
+            return
+
+        top_move = self._get_top_move(board, response['moves'])
+        if only_with_wins and not top_move['wins']:
+            return
+
+        move = chess.Move.from_uci(top_move['uci'])
+        message = f'Explore: {self.game.format_move(move):14} Performance: {top_move["performance"]}' \
+                  f'WDL: {top_move["wins"]}/{top_move["draws"]}/{top_move["losses"]}'
+        return Move_Response(move, message)
+
+    def _get_top_move(self, board: chess.Board, moves: list[dict]) -> dict:
+        selection = self.source_config['selection']
+        anti = self.source_config['anti']
+
+        if selection == 'win_rate':
+            for move in moves:
+                move['wins'] = move['white'] if board.turn else move['black']
+                move['losses'] = move['black'] if board.turn else move['white']
+
+            def win_performance(move: dict):
+                return (move['wins'] - move['losses']) / (move['white'] + move['draws'] + move['black'])
+
+            return max(moves, key=win_performance)
+
+        min_or_max = min if anti else max
+        top_move = min_or_max(moves, key=lambda move: move['performance'])
+        top_move['wins'] = top_move['white'] if board.turn else top_move['black']
+        top_move['losses'] = top_move['black'] if board.turn else top_move['white']
+        return top_move
+
+
+@register_move_source
+class Cloud_Source(Online_Move_Source):
+    name = 'lichess_cloud'
+    default_priority = 200
+    is_hedgeable = True
+
+    @classmethod
+    def from_config(cls, game: 'Lichess_Game') -> 'Move_Source | None':
+        source_config = cls.get_config(game.config)
+        if not source_config['enabled']:
+            return
+
+        has_book = game.config['opening_books']['enabled'] and Book_Source.get_book_key(game)
+        if source_config.get('only_without_book', False) and has_book:
+            return
+
+        return cls(game, source_config)
+
+    def _get_request(self, board: chess.Board, timeout: float) -> Online_Request | None:
+        api = self.game.api
+        if mirror_response := api.cloud_mirror.get(board):
+            # Positions of the mirror need no request, the others are still asked from Lichess.
+            return Online_Request('cloud_mirror', lambda: mirror_response, timeout)
+
+        fen = board.fen().replace('[', '/').replace(']', '')
+        variant = self.game.game_info.variant
+        return Online_Request('lichess_cloud', lambda: api.get_cloud_eval(fen, variant, timeout), timeout)
+
+    def _get_online_move(self, board: chess.Board, response: dict) -> Move_Response | None:
+        if 'error' in response or response['depth'] < self.source_config['min_eval_depth']:
+            return
+
+        pv = [chess.Move.from_uci(uci_move) for uci_move in response['pvs'][0]['moves'].split()]
+        score = chess.engine.Mate(response['pvs'][0]['mate']) if 'mate' in response['pvs'][0] \
+            else chess.engine.Cp(response['pvs'][0]['cp'])
+        pov_score = chess.engine.PovScore(score, chess.WHITE)
+        message = f'Cloud:   {self.game.format_move(pv[0]):14} {self.game.format_score(pov_score)}' \
+                  f'Depth: {response["depth"]}'
+        return Move_Response(pv[0], message, pv=pv)
+
+
+@register_move_source
+class Chessdb_Source(Online_Move_Source):
+    name = 'chessdb'
+    default_priority = 100
+    variants = ('chess',)
+    is_hedgeable = True
+
+    def __init__(self, game: 'Lichess_Game', source_config: dict) -> None:
+        super().__init__(game, source_config)
+        # Endgames are left to the tablebases.
+        self.min_pieces = 8
+
+    def _get_request(self, board: chess.Board, timeout: float) -> Online_Request | None:
+        fen = board.fen()
+        return Online_Request('chessdb', lambda: self.game.api.get_chessdb_eval(fen, timeout), timeout)
+
+    def _get_online_move(self, board: chess.Board, response: dict) -> Move_Response | None:
+        if response['status'] != 'ok' or response['depth'] < self.source_config['min_eval_depth']:
+            return
+
+        pv = [chess.Move.from_uci(uci_move) for uci_move in response['pv']]
+        pov_score = chess.engine.PovScore(chess.engine.Cp(response['score']), board.turn)
+        message = f'ChessDB: {self.game.format_move(pv[0]):14} {self.game.format_score(pov_score)}' \
+                  f'Depth: {response["depth"]}'
+        return Move_Response(pv[0], message, pv=pv)
+
+
+@register_move_source
+class Syzygy_Source(Move_Source):
+    name = 'syzygy'
+    default_priority = -100
+    variants = ('chess', 'antichess', 'atomic')
+    avoids_repetition = False
+    is_tablebase = True
+
+    def __init__(self, game: 'Lichess_Game', source_config: dict) -> None:
+        super().__init__(game, source_config)
+        self.max_pieces = source_config['max_pieces']
+        self.prober = Syzygy_Prober(game.handle_registry.acquire_syzygy(source_config['paths'], type(game.board)))
+
+    @classmethod
+    def get_config(cls, config: dict) -> dict:
+        return config['syzygy']
+
+    @classmethod
+    def from_config(cls, game: 'Lichess_Game') -> 'Move_Source | None':
+        if not cls.get_config(game.config)['instant_play']:
+            return
+
+        return super().from_config(game)
+
+    def is_applicable(self, board: chess.Board) -> bool:
+        return super().is_applicable(board) and not self.game.has_mate_score()
+
+    def close(self) -> None:
+        self.game.handle_registry.release(self.prober.tablebase)
+
+    def propose(self, board: chess.Board, deadline: float) -> Move_Response | None:  # pylint: disable=unused-argument
+        return self._record(self._probe(board))
+
+    def _probe(self, board: chess.Board) -> Move_Response | None:
+        try:
+            best_wdl, best_real_dtz, best_moves = self.prober.probe_root(board)
+        except chess.syzygy.MissingTableError:
+            return
+
+        if best_wdl == 2:
+            egtb_info = self.game.format_egtb_info('win', dtz=best_real_dtz)
+            offer_draw = False
+            resign = False
+        elif best_wdl == 1:
+            egtb_info = self.game.format_egtb_info('cursed win', dtz=best_real_dtz)
+            offer_draw = False
+            resign = False
+        elif best_wdl == 0:
+            egtb_info = self.game.format_egtb_info('draw', dtz=0)
+            offer_draw = True
+            resign = False
+        elif best_wdl == -1:
+            egtb_info = self.game.format_egtb_info('blessed loss', dtz=best_real_dtz)
+            offer_draw = True
+            resign = False
+        else:
+            egtb_info = self.game.format_egtb_info('loss', dtz=best_real_dtz)
+            offer_draw = False
+            resign = True
+
+        self.game.engine.stop_pondering()
+        move = random.choice(best_moves)
+        message = f'Syzygy:  {self.game.format_move(move):14} {egtb_info}'
+        return Move_Response(move, message, is_drawish=offer_draw, is_resignable=resign)
+
+
+@register_move_source
+class Gaviota_Source(Move_Source):
+    name = 'gaviota'
+    default_priority = -200
+    variants = ('chess',)
+    avoids_repetition = False
+    is_tablebase = True
+
+    def __init__(self, game: 'Lichess_Game', source_config: dict) -> None:
+        super().__init__(game, source_config)
+        self.max_pieces = source_config['max_pieces']
+        self.tablebase = game.handle_registry.acquire_gaviota(source_config['paths'],
+                                                              source_config.get('cache_entries', 100_000))
+
+    @classmethod
+    def get_config(cls, config: dict) -> dict:
+        return config['gaviota']
+
+    def close(self) -> None:
+        print(f'Gaviota cache: {self.tablebase.cache_statistics}')
+        self.game.handle_registry.release(self.tablebase)
+
+    def propose(self, board: chess.Board, deadline: float) -> Move_Response | None:
+        return self._record(self._probe(board, deadline))
+
+    def _probe(self, board: chess.Board, deadline: float) -> Move_Response | None:
+        if (candidates := self._get_best_wdl_moves(board)) is None:
+            return
+
+        candidate_moves, best_result = candidates
+        best_moves: list[chess.Move] = []
+        best_wdl = -2
+        best_dtm = 1_000_000
+        for move in candidate_moves:
+            board_copy = board.copy(stack=False)
+            board_copy.push(move)
+
+            if board_copy.is_checkmate():
+                wdl = 2
+                dtm = 0
+            elif best_result == 0:
+                # All candidates draw, their DTM does not matter.
+                wdl = 0
+                dtm = 0
+            elif time.monotonic() >= deadline:
+                # The DTM probes of long endgames can take longer than the sources have.
+                return
+            else:
+                try:
+                    dtm = -self.tablebase.probe_dtm(board_copy)
+                    wdl = value_to_wdl(dtm, board_copy.halfmove_clock)
+                except chess.gaviota.MissingTableError:
+                    return
+
+            if best_moves:
+                if wdl > best_wdl:
+                    best_moves = [move]
+                    best_wdl = wdl
+                    best_dtm = dtm
+                elif wdl == best_wdl:
+                    if dtm < best_dtm:
+                        best_moves = [move]
+                        best_dtm = dtm
+                    elif dtm == best_dtm:
+                        best_moves.append(move)
+            else:
+                best_moves.append(move)
+                best_wdl = wdl
+                best_dtm = dtm
+
+        if best_wdl == 2:
+            egtb_info = self.game.format_egtb_info('win', dtm=best_dtm)
+            offer_draw = False
+            resign = False
+        elif best_wdl == 0:
+            egtb_info = self.game.format_egtb_info('draw', dtm=0)
+            offer_draw = True
+            resign = False
+        elif best_wdl == -2:
+            egtb_info = self.game.format_egtb_info('loss', dtm=best_dtm)
+            offer_draw = False
+            resign = True
+        else:
+            return
+
+        self.game.engine.stop_pondering()
+        move = random.choice(best_moves)
+        message = f'Gaviota: {self.game.format_move(move):14} {egtb_info}'
+        return Move_Response(move, message, is_drawish=offer_draw, is_resignable=resign)
+
+    def _get_best_wdl_moves(self, board: chess.Board) -> tuple[list[chess.Move], int] | None:
+        # WDL probes are cheaper than DTM probes, only the moves with the best result are probed for their DTM.
+        results: dict[chess.Move, int] = {}
+        for move in board.legal_moves:
+            board_copy = board.copy(stack=False)
+            board_copy.push(move)
+
+            if board_copy.is_checkmate():
+                results[move] = 1
+                continue
+
+            try:
+                results[move] = -self.tablebase.probe_wdl(board_copy)
+            except chess.gaviota.MissingTableError:
+                return
+
+        if not results:
+            return
+
+        best_result = max(results.values())
+        return [move for move, result in results.items() if result == best_result], best_result
+
+
+@register_move_source
+class Egtb_Source(Online_Move_Source):
+    name = 'online_egtb'
+    default_priority = -300
+    variants = ('chess', 'antichess', 'atomic')
+    max_misses = None
+    avoids_repetition = False
+    is_tablebase = True
+    # The endgame is reached by too many different positions.
+    is_prefetched = False
+
+    def __init__(self, game: 'Lichess_Game', source_config: dict) -> None:
+        super().__init__(game, source_config)
+        self.max_pieces = 7 if game.board.uci_variant == 'chess' else 6
+
+    def is_applicable(self, board: chess.Board) -> bool:
+        return super().is_applicable(board) and not self.game.has_mate_score()
+
+    def _get_request(self, board: chess.Board, timeout: float) -> Online_Request | None:
+        variant = 'standard' if board.uci_variant == 'chess' else board.uci_variant
+        assert variant
+
+        fen = board.fen()
+        return Online_Request('online_egtb', lambda: self.game.api.get_egtb(fen, variant, timeout), timeout,
+                              str(board.halfmove_clock))
+
+    def _get_online_move(self, board: chess.Board, response: dict) -> Move_Response | None:
+        uci_move: str = response['moves'][0]['uci']
+        outcome: str = response['category']
+        dtz: int = -response['moves'][0]['dtz']
+        dtm: int | None = response['dtm']
+        offer_draw = outcome in ['draw', 'blessed loss']
+        resign = outcome == 'loss'
+        move = chess.Move.from_uci(uci_move)
+        message = f'EGTB:    {self.game.format_move(move):14} {self.game.format_egtb_info(outcome, dtz, dtm)}'
+        return Move_Response(move, message, is_drawish=offer_draw, is_resignable=resign)
@@ -0,0 +1,118 @@
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from typing import Any
+
+import chess
+import chess.polyglot
+
+
+class Online_Cache:
+    '''Two-level cache for the responses of the online move sources.
+
+    Responses are kept in an in-memory LRU and in a SQLite database, keyed by source, variant and Zobrist hash
+    of the position. Every source has its own time to live, a TTL of 0 disables caching for that source.'''
+
+    def __init__(self, config: dict) -> None:
+        cache_config: dict = config.get('online_cache', {})
+        self.enabled: bool = cache_config.get('enabled', False)
+        self.max_memory_entries: int = cache_config.get('memory_entries', 10_000)
+        self.max_entries: int = cache_config.get('max_entries', 1_000_000)
+        self.ttls: dict[str, int] = {'opening_explorer': cache_config.get('opening_explorer_ttl', 86_400),
+                                     'lichess_cloud': cache_config.get('lichess_cloud_ttl', 2_592_000),
+                                     'chessdb': cache_config.get('chessdb_ttl', 604_800),
+                                     'online_egtb': cache_config.get('online_egtb_ttl', 31_536_000)}
+        self.memory_entries: OrderedDict[tuple, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.inserts = 0
+        self.lock = Lock()
+
+        if self.enabled:
+            self.connection = sqlite3.connect(cache_config.get('path', 'online_cache.sqlite3'),
+                                              check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                    'source TEXT, variant TEXT, position INTEGER, params TEXT, '
+                                    'created REAL, response TEXT, PRIMARY KEY (source, variant, position, params))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_created ON responses (created)')
+
+    def get(self, source: str, board: chess.Board, params: str = '') -> dict[str, Any] | None:
+        if not self.is_enabled(source):
+            return
+
+        key = self._get_key(source, board, params)
+        min_created = time.time() - self.ttls[source]
+
+        with self.lock:
+            if entry := self.memory_entries.get(key):
+                if entry[0] >= min_created:
+                    self.memory_entries.move_to_end(key)
+                    # The move sources annotate the responses they evaluate.
+                    return deepcopy(entry[1])
+
+                del self.memory_entries[key]
+
+            row = self.connection.execute('SELECT created, response FROM responses '
+                                          'WHERE source = ? AND variant = ? AND position = ? AND params = ?',
+                                          key).fetchone()
+            if row is None or row[0] < min_created:
+                return
+
+            response = json.loads(row[1])
+            self._remember(key, row[0], response)
+            return response
+
+    def put(self, source: str, board: chess.Board, response: dict[str, Any], params: str = '') -> None:
+        if not self.is_enabled(source) or not self._is_cacheable(source, response):
+            return
+
+        key = self._get_key(source, board, params)
+        created = time.time()
+
+        with self.lock:
+            self._remember(key, created, response)
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                                    (*key, created, json.dumps(response)))
+
+            self.inserts += 1
+            if self.inserts % 1000 == 0:
+                self._enforce_size_cap()
+
+    def is_enabled(self, source: str) -> bool:
+        return self.enabled and self.ttls.get(source, 0) > 0
+
+    def _is_cacheable(self, source: str, response: dict[str, Any]) -> bool:
+        # Unknown positions are cached as well, errors like rate limits are not.
+        if source == 'lichess_cloud':
+            return response.get('error', 'Not found') == 'Not found'
+
+        if source == 'chessdb':
+            return response.get('status') in ['ok', 'unknown']
+
+        return True
+
+    def _get_key(self, source: str, board: chess.Board, params: str) -> tuple[str, str, int, str]:
+        # SQLite integers are signed 64 bit.
+        position = chess.polyglot.zobrist_hash(board) - 2 ** 63
+        if board.uci_variant in ['crazyhouse', '3check']:
+            # Pockets and remaining checks are not part of the Zobrist hash.
+            params = f'{params} {board.epd()}'
+
+        return source, board.uci_variant or 'chess', position, params
+
+    def _remember(self, key: tuple, created: float, response: dict[str, Any]) -> None:
+        self.memory_entries[key] = created, deepcopy(response)
+        self.memory_entries.move_to_end(key)
+        while len(self.memory_entries) > self.max_memory_entries:
+            self.memory_entries.popitem(last=False)
+
+    def _enforce_size_cap(self) -> None:
+        entry_count: int = self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        if entry_count <= self.max_entries:
+            return
+
+        self.connection.execute('DELETE FROM responses WHERE rowid IN '
+                                '(SELECT rowid FROM responses ORDER BY created LIMIT ?)',
+                                (entry_count - self.max_entries,))
@@ -0,0 +1,27 @@
+import time
+from collections import defaultdict, deque
+from threading import Lock
+
+
+class Rate_Limiter:
+    '''Allows at most max_requests per key within a sliding window of period seconds.'''
+
+    def __init__(self, max_requests: int, period: float) -> None:
+        self.max_requests = max_requests
+        self.period = period
+        self.requests: defaultdict[str, deque[float]] = defaultdict(deque)
+        self.lock = Lock()
+
+    def try_acquire(self, key: str) -> bool:
+        now = time.monotonic()
+
+        with self.lock:
+            requests = self.requests[key]
+            while requests and requests[0] <= now - self.period:
+                requests.popleft()
+
+            if len(requests) >= self.max_requests:
+                return False
+
+            requests.append(now)
+            return True
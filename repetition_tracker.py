@@ -0,0 +1,46 @@
+from collections import Counter
+from collections.abc import Hashable
+
+import chess
+import chess.polyglot
+
+
+class Repetition_Tracker:
+    '''Counts how often every position of a game occurred, so repetition checks need no board copies.
+
+    Positions are keyed by Zobrist hash. Positions before an irreversible move can not occur again, so
+    counting over the whole game gives the same result as python-chess' walk over the move stack.'''
+
+    def __init__(self, board: chess.Board) -> None:
+        self.position_counts: Counter[Hashable] = Counter()
+
+        replay_board = board.root()
+        self.position_counts[self._get_key(replay_board)] += 1
+        for move in board.move_stack:
+            replay_board.push(move)
+            self.position_counts[self._get_key(replay_board)] += 1
+
+    def push(self, board: chess.Board, move: chess.Move) -> None:
+        board.push(move)
+        self.position_counts[self._get_key(board)] += 1
+
+    def pop(self, board: chess.Board) -> chess.Move:
+        self.position_counts[self._get_key(board)] -= 1
+        return board.pop()
+
+    def is_repetition(self, board: chess.Board, count: int = 3) -> bool:
+        return self.position_counts[self._get_key(board)] >= count
+
+    def is_repetition_after(self, board: chess.Board, move: chess.Move, count: int = 2) -> bool:
+        board.push(move)
+        key = self._get_key(board)
+        board.pop()
+
+        return self.position_counts[key] + 1 >= count
+
+    def _get_key(self, board: chess.Board) -> Hashable:
+        if board.uci_variant in ['crazyhouse', '3check']:
+            # Pockets and remaining checks are not part of the Zobrist hash.
+            return chess.polyglot.zobrist_hash(board), board.epd()
+
+        return chess.polyglot.zobrist_hash(board)
@@ -0,0 +1,103 @@
+import math
+import os
+import sys
+from threading import Lock
+
+from aliases import Game_ID
+
+
+class Resource_Allocator:
+    def __init__(self, config: dict) -> None:
+        resources_config: dict = config.get('engine_resources', {})
+        self.enabled: bool = resources_config.get('enabled', False)
+        self.threads: int = resources_config.get('threads', 1)
+        self.hash_size: int = resources_config.get('hash', 256)
+        self.min_hash_size: int = resources_config.get('min_hash', 16)
+        self.cpu_affinity: bool = resources_config.get('cpu_affinity', False)
+        self.reserved_cpus: int = resources_config.get('reserved_cpus', 0)
+        self.clocks: dict[Game_ID, float | None] = {}
+        self.lock = Lock()
+        self.cpus = self._get_engine_cpus() if self.cpu_affinity else []
+
+    def add_game(self, game_id: Game_ID) -> None:
+        with self.lock:
+            self.clocks[game_id] = None
+
+    def remove_game(self, game_id: Game_ID) -> None:
+        with self.lock:
+            self.clocks.pop(game_id, None)
+
+    def get_resources(self, game_id: Game_ID, own_time: float) -> tuple[int, int] | None:
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.clocks[game_id] = own_time
+            weights = self._get_weights()
+
+        threads = self._get_shares(weights, self.threads, 1)[game_id]
+        hash_size = self._get_shares(weights, self.hash_size, self.min_hash_size)[game_id]
+        # Engines clear their hash table on every resize, rounding keeps the size stable between moves.
+        hash_size = max(2 ** int(math.log2(hash_size)), self.min_hash_size)
+        return threads, hash_size
+
+    def get_cpus(self, game_id: Game_ID) -> set[int] | None:
+        if not self.cpus:
+            return
+
+        with self.lock:
+            if game_id not in self.clocks:
+                return
+
+            shares = self._get_shares(self._get_weights(), len(self.cpus), 1)
+
+        # Consecutive CPUs per game in the order the games started, they only overlap with more games than CPUs.
+        offset = 0
+        for share_game_id, share in shares.items():
+            if share_game_id == game_id:
+                return {self.cpus[(offset + index) % len(self.cpus)] for index in range(share)}
+
+            offset += share
+
+    def _get_engine_cpus(self) -> list[int]:
+        if sys.platform != 'linux':
+            print('CPU affinity is only supported on Linux.')
+            return []
+
+        cpus = sorted(os.sched_getaffinity(0))
+        if self.reserved_cpus <= 0 or self.reserved_cpus >= len(cpus):
+            return cpus
+
+        # Affinity is per thread, every running thread of the bot is moved and new threads inherit the mask.
+        try:
+            for thread_id in os.listdir('/proc/self/task'):
+                os.sched_setaffinity(int(thread_id), cpus[:self.reserved_cpus])
+        except OSError as e:
+            print(f'Reserving CPUs for the bot failed: {e}')
+
+        return cpus[self.reserved_cpus:]
+
+    def _get_weights(self) -> dict[Game_ID, float]:
+        known_clocks = [clock for clock in self.clocks.values() if clock is not None]
+        default_clock = sum(known_clocks) / len(known_clocks) if known_clocks else 1.0
+
+        # Games with more clock left search longer per move and profit more from additional resources.
+        return {game_id: math.sqrt(max(default_clock if clock is None else clock, 1.0))
+                for game_id, clock in self.clocks.items()}
+
+    def _get_shares(self, weights: dict[Game_ID, float], budget: int, minimum: int) -> dict[Game_ID, int]:
+        total_weight = sum(weights.values())
+        exact_shares = {game_id: max(budget * weight / total_weight, minimum) for game_id, weight in weights.items()}
+        shares = {game_id: int(exact_share) for game_id, exact_share in exact_shares.items()}
+
+        # Hand out the rounding remainder to the games with the largest fractional parts.
+        remainder = budget - sum(shares.values())
+        for game_id in sorted(exact_shares, key=lambda game_id: exact_shares[game_id] - shares[game_id],
+                              reverse=True):
+            if remainder <= 0:
+                break
+
+            shares[game_id] += 1
+            remainder -= 1
+
+        return shares
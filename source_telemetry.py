@@ -0,0 +1,81 @@
+import json
+import os
+from collections import defaultdict
+from threading import Lock
+
+from lichess_bot_dataclasses import Source_Statistics
+
+
+class Source_Telemetry:
+    '''Lifetime statistics of the move sources, shared by all games and kept across restarts.
+
+    Every game adds its statistics when it ends, the file is rewritten after each game and doubles as the
+    machine-readable dump. Time saved is the projected clock of an engine move minus the wait for the source,
+    misses subtract the time the game waited for nothing.'''
+
+    def __init__(self, config: dict) -> None:
+        telemetry_config: dict = config.get('source_telemetry', {})
+        self.enabled: bool = telemetry_config.get('enabled', False)
+        self.path: str = telemetry_config.get('path', 'source_telemetry.json')
+        self.games = 0
+        self.sources: defaultdict[str, Source_Statistics] = defaultdict(Source_Statistics)
+        self.lock = Lock()
+
+        if self.enabled:
+            self._load()
+
+    def add_game(self, game_statistics: dict[str, Source_Statistics]) -> None:
+        if not self.enabled or not game_statistics:
+            return
+
+        with self.lock:
+            self.games += 1
+            for source, statistics in game_statistics.items():
+                self.sources[source].merge(statistics)
+
+            self._save(self.path)
+
+    def dump(self, path: str) -> None:
+        with self.lock:
+            self._save(path)
+
+    def to_dict(self) -> dict:
+        return {'games': self.games,
+                'sources': {source: statistics.to_dict() for source, statistics in self.sources.items()}}
+
+    def __str__(self) -> str:
+        if not self.enabled:
+            return 'Move source telemetry is disabled, enable it in the source_telemetry section of the config.'
+
+        with self.lock:
+            if not self.sources:
+                return 'No move source statistics yet.'
+
+            lines = [f'{source:17} {statistics}' for source, statistics in self.sources.items()]
+
+        return '\n'.join([f'Move sources in {self.games} games:', *lines])
+
+    def _load(self) -> None:
+        if not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, encoding='utf-8') as json_input:
+                telemetry = json.load(json_input)
+        except (OSError, ValueError) as e:
+            print(f'Loading the move source statistics failed: {e}')
+            return
+
+        self.games = telemetry.get('games', 0)
+        for source, statistics in telemetry.get('sources', {}).items():
+            self.sources[source] = Source_Statistics.from_dict(statistics)
+
+    def _save(self, path: str) -> None:
+        try:
+            # A crash while writing must not lose the statistics of all previous games.
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as json_output:
+                json.dump(self.to_dict(), json_output, indent=4)
+
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            print(f'Saving the move source statistics to "{path}" failed: {e}')
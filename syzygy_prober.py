@@ -0,0 +1,105 @@
+from collections import defaultdict
+
+import chess
+import chess.polyglot
+import chess.syzygy
+
+
+def value_to_wdl(value: int, halfmove_clock: int) -> int:
+    if value > 0:
+        if value + halfmove_clock <= 100:
+            return 2
+
+        return 1
+
+    if value < 0:
+        if value - halfmove_clock >= -100:
+            return -2
+
+        return -1
+
+    return 0
+
+
+class Syzygy_Prober:
+    '''Ranks the root moves with the Syzygy tablebases of a game.
+
+    All children are probed for WDL first, DTZ is only probed for the moves that can still be best after the
+    50-move rule is applied. Probe results are cached by Zobrist key for the rest of the game.'''
+
+    def __init__(self, tablebase: chess.syzygy.Tablebase) -> None:
+        self.tablebase = tablebase
+        self.wdl_cache: dict[int, int] = {}
+        self.dtz_cache: dict[int, int] = {}
+
+    def probe_root(self, board: chess.Board) -> tuple[int, int, list[chess.Move]]:
+        '''Returns the best WDL including the 50-move rule, its DTZ and all moves that reach both.
+
+        Raises chess.syzygy.MissingTableError if a child position is not covered by the tablebases.'''
+
+        board = board.copy(stack=False)
+        moves_by_wdl: defaultdict[int, list[chess.Move]] = defaultdict(list)
+        for move in list(board.legal_moves):
+            board.push(move)
+            moves_by_wdl[-self._probe_wdl(board)].append(move)
+            board.pop()
+
+        best_table_wdl = max(moves_by_wdl)
+        if best_table_wdl == 0:
+            return 0, 0, moves_by_wdl[0]
+
+        if best_table_wdl > 0:
+            best_wdl, best_dtz, best_moves = self._rank_by_dtz(board, moves_by_wdl[best_table_wdl])
+            if best_wdl == best_table_wdl:
+                return best_wdl, best_dtz, best_moves
+
+            # All wins turn into cursed wins with the current halfmove clock and tie with the cursed wins.
+            return self._rank_by_dtz(board, moves_by_wdl[2] + moves_by_wdl[1])
+
+        # Losses can turn into blessed losses with the current halfmove clock.
+        return self._rank_by_dtz(board, moves_by_wdl[-1] + moves_by_wdl[-2])
+
+    def _rank_by_dtz(self, board: chess.Board, moves: list[chess.Move]) -> tuple[int, int, list[chess.Move]]:
+        best_moves: list[chess.Move] = []
+        best_wdl = -2
+        best_dtz = 1_000_000
+        best_real_dtz = best_dtz
+        for move in moves:
+            board.push(move)
+            dtz = -self._probe_dtz(board)
+            halfmove_clock = board.halfmove_clock
+            board.pop()
+
+            wdl = value_to_wdl(dtz, halfmove_clock)
+
+            real_dtz = dtz
+            if halfmove_clock == 0:
+                # Zeroing moves are preferred when winning and avoided when losing.
+                if wdl < 0:
+                    dtz += 10_000
+                elif wdl > 0:
+                    dtz -= 10_000
+
+            if not best_moves or wdl > best_wdl or (wdl == best_wdl and dtz < best_dtz):
+                best_moves = [move]
+                best_wdl = wdl
+                best_dtz = dtz
+                best_real_dtz = real_dtz
+            elif wdl == best_wdl and dtz == best_dtz:
+                best_moves.append(move)
+
+        return best_wdl, best_real_dtz, best_moves
+
+    def _probe_wdl(self, board: chess.Board) -> int:
+        key = chess.polyglot.zobrist_hash(board)
+        if key not in self.wdl_cache:
+            self.wdl_cache[key] = self.tablebase.probe_wdl(board)
+
+        return self.wdl_cache[key]
+
+    def _probe_dtz(self, board: chess.Board) -> int:
+        key = chess.polyglot.zobrist_hash(board)
+        if key not in self.dtz_cache:
+            self.dtz_cache[key] = self.tablebase.probe_dtz(board)
+
+        return self.dtz_cache[key]
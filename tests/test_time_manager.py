@@ -0,0 +1,71 @@
+import chess
+import chess.engine
+
+from time_manager import Time_Manager
+
+LAG = 0.1
+MOVE_OVERHEAD = 1.0
+
+
+def _get_charged_time(limit: chess.engine.Limit) -> float:
+    if limit.time is not None:
+        return limit.time + LAG
+
+    # Engines spend a share of the remaining clock and most of the increment.
+    assert limit.white_clock is not None and limit.white_inc is not None
+    return limit.white_clock / 30 + limit.white_inc * 0.75 + LAG
+
+
+def _play(policy: str, initial_time: float, increment: float, moves: int = 150) -> tuple[list[float], list[float]]:
+    '''Returns the time charged for each of our moves and our clock after it.'''
+
+    time_manager = Time_Manager.from_config({'time_management': {'policy': policy}}, True, True)
+    board = chess.Board()
+    own_time = opponent_time = initial_time
+    scores: list[chess.engine.PovScore | None] = []
+    move_times: list[float] = []
+    clocks: list[float] = []
+
+    for _ in range(moves):
+        limit = time_manager.get_limit(board, own_time=own_time, opponent_time=opponent_time, increment=increment,
+                                       move_overhead=MOVE_OVERHEAD, scores=scores, after_book=False)
+        # The clocks only start running after the first move of each side.
+        is_timed = len(board.move_stack) >= 2
+        move_time = _get_charged_time(limit) if is_timed else 0.0
+        own_time -= move_time
+        move_times.append(move_time)
+        clocks.append(own_time)
+        if is_timed:
+            own_time += increment
+            opponent_time += increment - min(initial_time / 40, opponent_time / 2)
+
+        scores.append(None)
+        board.push(chess.Move.null())
+        board.push(chess.Move.null())
+
+    return move_times, clocks
+
+
+def test_bullet_game_never_flags() -> None:
+    for policy in ['engine', 'adaptive']:
+        _, clocks = _play(policy, 60.0, 1.0)
+        assert min(clocks) > 0.0, policy
+
+
+def test_rapid_game_never_flags() -> None:
+    for policy in ['engine', 'adaptive']:
+        _, clocks = _play(policy, 600.0, 5.0)
+        assert min(clocks) > 0.0, policy
+
+
+def test_rapid_game_uses_the_clock() -> None:
+    move_times, clocks = _play('adaptive', 600.0, 5.0)
+
+    # Most of the clock is spent by move 40 instead of being carried into the endgame unused.
+    assert 0.1 < clocks[39] / 600.0 < 0.5
+
+    # The middlegame gets almost as much time per move as the opening, and far more than the increment.
+    opening_time = sum(move_times[1:10]) / 9
+    middlegame_time = sum(move_times[20:40]) / 20
+    assert middlegame_time > 0.7 * opening_time
+    assert middlegame_time > 2 * 5.0
@@ -0,0 +1,169 @@
+from abc import ABC, abstractmethod
+from itertools import islice
+
+import chess
+import chess.engine
+
+
+class Time_Manager(ABC):
+    def __init__(self, config: dict, is_white: bool, opponent_is_engine: bool) -> None:
+        self.is_white = is_white
+        self.first_move_time = 15.0 if opponent_is_engine else 5.0
+        time_management_config: dict = config.get('time_management', {})
+        self.moves_to_go: int = time_management_config.get('moves_to_go', 40)
+        self.min_moves_to_go: int = time_management_config.get('min_moves_to_go', 15)
+        online_budget_config: dict = config.get('online_time_budget', {})
+        self.online_budget_enabled: bool = online_budget_config.get('enabled', False)
+        self.online_fraction: float = online_budget_config.get('fraction', 0.5)
+        self.min_online_timeout: float = online_budget_config.get('min_timeout', 0.2)
+
+    @classmethod
+    def from_config(cls, config: dict, is_white: bool, opponent_is_engine: bool) -> 'Time_Manager':
+        policy = config.get('time_management', {}).get('policy', 'engine')
+
+        if policy == 'engine':
+            return Engine_Time_Manager(config, is_white, opponent_is_engine)
+
+        if policy == 'adaptive':
+            return Adaptive_Time_Manager(config, is_white, opponent_is_engine)
+
+        raise RuntimeError(f'Unknown time management policy "{policy}".')
+
+    @abstractmethod
+    def get_limit(self,
+                  board: chess.Board,
+                  *,
+                  own_time: float,
+                  opponent_time: float,
+                  increment: float,
+                  move_overhead: float,
+                  scores: list[chess.engine.PovScore | None],
+                  after_book: bool
+                  ) -> chess.engine.Limit:
+        '''Returns the search limit of the engine move in the position of the board.'''
+
+    def get_online_timeout(self,
+                           board: chess.Board,
+                           own_time: float,
+                           increment: float,
+                           move_overhead: float,
+                           source_config: dict
+                           ) -> float | None:
+        '''Returns the time an online lookup may take or None if there is no time for it.
+
+        The configured timeout of the source is only an upper bound, the lookup gets a fraction of the
+        projected time per move.'''
+
+        if not self.online_budget_enabled:
+            return source_config['timeout'] if own_time >= source_config['min_time'] else None
+
+        timeout = min(source_config['timeout'], self.get_source_budget(board, own_time, increment, move_overhead))
+        return timeout if timeout >= self.min_online_timeout else None
+
+    def get_source_budget(self, board: chess.Board, own_time: float, increment: float, move_overhead: float) -> float:
+        '''Returns the seconds all move sources together may take before the engine searches.
+
+        Without the online time budget the sources are only bound by their own timeouts.'''
+
+        if not self.online_budget_enabled:
+            return float('inf')
+
+        return self.get_move_time(board, own_time, increment, move_overhead) * self.online_fraction
+
+    def get_move_time(self, board: chess.Board, own_time: float, increment: float, move_overhead: float) -> float:
+        '''Returns the projected time per move, the clock an engine move is expected to cost.'''
+
+        return max(own_time - move_overhead, 0.0) / self._get_moves_to_go(board) + increment
+
+    def _get_moves_to_go(self, board: chess.Board) -> int:
+        # The longer a game lasts, the longer it is expected to go on. Every two moves played therefore take only
+        # one move off the expected remaining moves, which never drop below min_moves_to_go.
+        moves_played = board.fullmove_number - 1
+        return max(self.moves_to_go - moves_played // 2, self.min_moves_to_go)
+
+    def _get_clock_limit(self, own_time: float, opponent_time: float, increment: float) -> chess.engine.Limit:
+        white_time = own_time if self.is_white else opponent_time
+        black_time = opponent_time if self.is_white else own_time
+
+        return chess.engine.Limit(white_clock=white_time, white_inc=increment,
+                                  black_clock=black_time, black_inc=increment)
+
+
+class Engine_Time_Manager(Time_Manager):
+    '''Leaves the time management to the engine and only subtracts the move overhead from our clock.'''
+
+    def get_limit(self,
+                  board: chess.Board,
+                  *,
+                  own_time: float,
+                  opponent_time: float,
+                  increment: float,
+                  move_overhead: float,
+                  scores: list[chess.engine.PovScore | None],
+                  after_book: bool
+                  ) -> chess.engine.Limit:
+        if len(board.move_stack) < 2:
+            return chess.engine.Limit(time=self.first_move_time)
+
+        own_time = own_time - move_overhead if own_time > move_overhead else own_time / 2
+        return self._get_clock_limit(own_time, opponent_time, increment)
+
+
+class Adaptive_Time_Manager(Time_Manager):
+    '''Computes an explicit move time from the clocks, the game phase and the stability of the evaluation.'''
+
+    def __init__(self, config: dict, is_white: bool, opponent_is_engine: bool) -> None:
+        super().__init__(config, is_white, opponent_is_engine)
+        time_management_config: dict = config.get('time_management', {})
+        self.max_fraction: float = time_management_config.get('max_fraction', 0.2)
+        self.min_time: float = time_management_config.get('min_time', 0.05)
+
+    def get_limit(self,
+                  board: chess.Board,
+                  *,
+                  own_time: float,
+                  opponent_time: float,
+                  increment: float,
+                  move_overhead: float,
+                  scores: list[chess.engine.PovScore | None],
+                  after_book: bool
+                  ) -> chess.engine.Limit:
+        available_time = max(own_time - move_overhead, 0.0)
+
+        if len(board.move_stack) < 2:
+            return chess.engine.Limit(time=max(min(self.first_move_time, available_time / 20), self.min_time))
+
+        move_time = available_time / self._get_moves_to_go(board) + increment * 0.8
+        move_time *= self._get_clock_factor(own_time, opponent_time)
+        move_time *= self._get_stability_factor(scores)
+
+        if after_book:
+            # The first engine move out of book usually decides the middlegame plan.
+            move_time *= 1.5
+
+        move_time = min(move_time, available_time * self.max_fraction + increment * 0.5)
+        return chess.engine.Limit(time=max(move_time, self.min_time))
+
+    def _get_clock_factor(self, own_time: float, opponent_time: float) -> float:
+        if opponent_time <= 0.0:
+            return 1.0
+
+        # Spend up to 20 % more when ahead on the clock and up to 20 % less when behind.
+        return min(max(own_time / opponent_time, 0.8), 1.2)
+
+    def _get_stability_factor(self, scores: list[chess.engine.PovScore | None]) -> float:
+        last_scores = [score.relative.score(mate_score=40000)
+                       for score in islice(scores, max(len(scores) - 3, 0), None)
+                       if score is not None]
+
+        if len(last_scores) < 2:
+            return 1.0
+
+        swing = max(last_scores) - min(last_scores)
+        if swing > 100:
+            return 1.3
+
+        if swing < 30:
+            return 0.8
+
+        return 1.0
@@ -9,6 +9,7 @@ from api import API
 from lichess_bot_dataclasses import Challenge_Request
 from config import load_config
 from engine import Engine
+from engine_bench import Engine_Bench
 from enums import Challenge_Color, Perf_Type, Variant
 from event_handler import Event_Handler
 from game_manager import Game_Manager
@@ -29,16 +30,30 @@ COMMANDS = {
     'quit': 'Exits the bot.',
     'clear': 'Clears the challenge queue.',
     'reset': 'Resets matchmaking. Usage: reset PERF_TYPE',
-    'stop': 'Stops matchmaking mode.'
+    'stop': 'Stops matchmaking mode.',
+    'telemetry': 'Prints the move source statistics or writes them as JSON. Usage: telemetry [PATH]'
 }
 
 EnumT = TypeVar('EnumT', bound=Enum)
 
 
 class UserInterface:
-    def __init__(self, config_path: str, start_matchmaking: bool, allow_upgrade: bool) -> None:
+    def __init__(self,
+                 config_path: str,
+                 start_matchmaking: bool,
+                 allow_upgrade: bool,
+                 *,
+                 bench: bool,
+                 bench_output: str | None,
+                 explorer_pgn: str | None,
+                 cloud_eval_dump: str | None
+                 ) -> None:
         self.start_matchmaking = start_matchmaking
         self.allow_upgrade = allow_upgrade
+        self.bench = bench
+        self.bench_output = bench_output
+        self.explorer_pgn = explorer_pgn
+        self.cloud_eval_dump = cloud_eval_dump
         self.config = load_config(config_path)
         self.api = API(self.config)
         self.is_running = True
@@ -47,6 +62,22 @@ class UserInterface:
         print(LOGO, end=' ')
         print(self.config['version'], end='\n\n')
 
+        if self.bench:
+            Engine_Bench(self.config).run(self.bench_output)
+            return
+
+        if self.explorer_pgn:
+            if not self.api.local_explorer.enabled:
+                print('The local explorer must be enabled in the config to import games.')
+                return
+
+            self.api.local_explorer.import_pgn(self.explorer_pgn, self.api.get_account()['username'])
+            return
+
+        if self.cloud_eval_dump:
+            self.api.cloud_mirror.import_dump(self.cloud_eval_dump)
+            return
+
         self._post_init()
         self._test_engines()
 
@@ -94,6 +125,8 @@ class UserInterface:
                 self._reset(command, game_manager)
             elif command[0] == 'stop':
                 self._stop(game_manager)
+            elif command[0] == 'telemetry':
+                self._telemetry(command)
             else:
                 self._help()
 
@@ -271,6 +304,18 @@ class UserInterface:
         else:
             print('Matchmaking is not currently running ...')
 
+    def _telemetry(self, command: list[str]) -> None:
+        if len(command) > 2:
+            print(COMMANDS['telemetry'])
+            return
+
+        if len(command) == 1:
+            print(self.api.source_telemetry)
+            return
+
+        self.api.source_telemetry.dump(command[1])
+        print(f'Move source statistics written to "{command[1]}".')
+
     def _help(self) -> None:
         print('These commands are supported by Lichess-Bot:\n')
         for key, value in COMMANDS.items():
@@ -307,11 +352,22 @@ if __name__ == '__main__':
     parser.add_argument('--config', '-c', default='config.yml', type=str, help='Path to config.yml.')
     parser.add_argument('--matchmaking', '-m', action='store_true', help='Start matchmaking mode.')
     parser.add_argument('--upgrade', '-u', action='store_true', help='Upgrade account to BOT account.')
+    parser.add_argument('--bench', '-b', action='store_true', help='Benchmark the engines and exit.')
+    parser.add_argument('--bench-output', type=str, help='Path to write the recommended engine settings to.')
+    parser.add_argument('--import-explorer', metavar='PGN', type=str,
+                        help='Import the rated games of the bot from a PGN file into the local explorer and exit.')
+    parser.add_argument('--import-cloud-evals', metavar='JSONL', type=str,
+                        help='Build the cloud mirror from the decompressed Lichess evaluation dump '
+                             '("-" for stdin) and exit.')
     parser.add_argument('--debug', '-d', action='store_const', const=logging.DEBUG,
                         default=logging.WARNING, help='Enable debug logging.')
     args = parser.parse_args()
 
     logging.basicConfig(level=args.debug)
 
-    ui = UserInterface(args.config, args.matchmaking, args.upgrade)
+    ui = UserInterface(args.config, args.matchmaking, args.upgrade,
+                       bench=args.bench,
+                       bench_output=args.bench_output,
+                       explorer_pgn=args.import_explorer,
+                       cloud_eval_dump=args.import_cloud_evals)
     ui.main()